@@ -0,0 +1,205 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from .SweepReader import SweepReader
+from .Reference import reference_csv
+from .Config import read_config, get_cutback
+from .Profiler import Profiler
+from .ResultsStore import ResultsStore
+from .LossTable import LOSS_COLUMNS, compute_losses, write_csv
+
+BATCH_COLUMNS = ['Chip', 'Measurement'] + LOSS_COLUMNS
+
+
+def run_job(job):
+    """Module level entry point so the job can be sent to a worker process"""
+    return job.run()
+
+
+class BatchJob:
+    """One measurement folder, i.e. 01_Becky/1550_TE, analyzed by Execute"""
+
+    def __init__(self, chip_name, base_path, ref_file_path, measure_date, process, results_directory,
+                 cache_dir=None, streaming=False, profile=False, cprofile=False, numbers_only=False,
+                 results_store=None, qc=True):
+        self.chip_name = chip_name
+        self.base_path = base_path
+        self.ref_file_path = ref_file_path
+        self.measure_date = measure_date
+        self.process = process
+        self.results_directory = results_directory
+        self.cache_dir = cache_dir
+        self.streaming = streaming
+        self.profile = profile
+        self.cprofile = cprofile
+        self.numbers_only = numbers_only  # Only the loss table: no figures, PDF, pandas or matplotlib
+        self.results_store = results_store
+        self.qc = qc
+
+    @property
+    def measurement(self):
+        return os.path.basename(self.base_path)
+
+    def run(self):
+        """Generate the report, or only the loss table, and return the loss rows labelled with the job"""
+        if self.numbers_only:
+            profiler = Profiler.for_results(self.results_directory, self.profile, self.cprofile)
+            profiler.start()
+            try:
+                rows = compute_losses(self.base_path, self.ref_file_path, cache_dir=self.cache_dir,
+                                      streaming=self.streaming, profiler=profiler, qc=self.qc)
+            finally:
+                profiler.stop()  # Never leave cProfile enabled in the worker
+            if rows is None:
+                raise ValueError(f"Error reading reference data {self.ref_file_path}")
+            write_csv(rows, os.path.join(self.results_directory, 'loss_data.csv'))
+            if profiler.enabled:
+                profiler.write(os.path.join(self.results_directory, 'profile.json'))
+
+            if self.results_store:
+                ref_file_path, _ = get_cutback(self.base_path, read_config(self.base_path))
+                ResultsStore(self.results_store).append(rows, self.chip_name, self.measurement, self.measure_date,
+                                                        self.process, ref_file_path or self.ref_file_path)
+        else:
+            from .Execute import Execute  # Loads pandas, matplotlib and reportlab only for reports
+
+            executor = Execute(self.base_path, self.ref_file_path, self.chip_name, self.measure_date, self.process,
+                               results_directory=self.results_directory, cache_dir=self.cache_dir,
+                               figure_workers=1,  # The batch already keeps every core busy
+                               streaming=self.streaming, profile=self.profile, cprofile=self.cprofile,
+                               results_store=self.results_store, qc=self.qc)
+            executor.genReport()
+            rows = executor.loss_rows
+
+        return [{'Chip': self.chip_name, 'Measurement': self.measurement, **row} for row in rows]
+
+
+class BatchRunner:
+    """Analyze every chip/measurement folder below a root directory across a process pool"""
+
+    def __init__(self, root_path, process='PWB', measure_date=None, workers=None, cache_dir=None, streaming=False,
+                 profile=False, cprofile=False, numbers_only=False,
+                 results_store=None, qc=True):
+        self.root_path = root_path
+        self.process = process
+        self.measure_date = measure_date
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.streaming = streaming
+        self.profile = profile  # Each job writes profile.json to its results directory
+        self.cprofile = cprofile
+        self.numbers_only = numbers_only
+        self.results_store = results_store  # SQLite file each job appends its losses to
+        self.qc = qc  # Sweep QC before fitting, False fits every point of every sweep
+
+        self.reader = SweepReader()
+        self.failures = []
+
+    def is_measurement_folder(self, folder_path):
+        """A measurement folder holds the calibration_ST2ST bond folders"""
+        return any('calibration_ST2ST' in name and os.path.isdir(os.path.join(folder_path, name))
+                   for name in os.listdir(folder_path))
+
+    def find_measurement_folders(self):
+        """Walk the root for measurement folders, i.e. 01_Becky/1310_TE and 01_Becky/1550_TE"""
+        folders = []
+        for root, dirs, _ in os.walk(self.root_path):
+            dirs[:] = sorted(d for d in dirs if d != 'analysis_results')
+            if self.is_measurement_folder(root):
+                folders.append(root)
+                dirs[:] = []  # Bond folders do not nest further measurements
+        return folders
+
+    def find_reference_file(self, base_path):
+        """Reference CSV named by config.yaml 'reference', else the used_ref_* or first ref_long_* folder
+
+        A list under 'reference', i.e. [ref_short_2_1, ref_long_2_1], gives a list of CSVs to average.
+        """
+        reference = None
+        if os.path.exists(os.path.join(base_path, 'config.yaml')):
+            reference = read_config(base_path).get('reference')
+
+        if reference is None:
+            folders = sorted(os.listdir(base_path))
+            candidates = ([f for f in folders if f.startswith('used_ref')] +
+                          [f for f in folders if f.startswith('ref_long')])
+            if not candidates:
+                raise FileNotFoundError(f"No reference folder found in {base_path}")
+            reference = candidates[0]
+
+        if isinstance(reference, list):
+            return [reference_csv(base_path, name) for name in reference]
+        return reference_csv(base_path, reference)
+
+    def get_measure_date(self, ref_file_path):
+        """Measurement date from the sweep header, i.e. 'Start: 03-Jul-2024 18:07:47' -> '2024-07-03'"""
+        if self.measure_date:
+            return self.measure_date
+        if isinstance(ref_file_path, list):
+            ref_file_path = ref_file_path[0]
+        start = self.reader.read_header(ref_file_path)['Start']
+        return datetime.strptime(start, "%d-%b-%Y %H:%M:%S").strftime("%Y-%m-%d")
+
+    def make_jobs(self):
+        """Build a job per measurement folder; folders that cannot be set up are recorded as failures"""
+        jobs = []
+        for base_path in self.find_measurement_folders():
+            chip_path = os.path.dirname(base_path)
+            chip_name = os.path.basename(chip_path)
+            try:
+                ref_file_path = self.find_reference_file(base_path)
+                measure_date = self.get_measure_date(ref_file_path)
+            except Exception as e:
+                self.failures.append({'Chip': chip_name, 'Measurement': os.path.basename(base_path),
+                                      'Error': repr(e)})
+                continue
+
+            # Give each folder its own results directory so parallel jobs do not overwrite each other
+            results_directory = os.path.join(chip_path, 'analysis_results', os.path.basename(base_path))
+            jobs.append(BatchJob(chip_name, base_path, ref_file_path, measure_date, self.process,
+                                 results_directory, cache_dir=self.cache_dir, streaming=self.streaming,
+                                 profile=self.profile, cprofile=self.cprofile,
+                                 numbers_only=self.numbers_only, results_store=self.results_store,
+                                 qc=self.qc))
+        return jobs
+
+    def run(self):
+        """Run every job in the pool and write the combined loss table and any failures under root_path
+
+        Returns the combined loss rows, sorted by chip, measurement, wavelength, channel and bond, and the failures.
+        """
+        self.failures = []
+        jobs = self.make_jobs()
+
+        loss_rows = []
+        n_succeeded = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(run_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    loss_rows.extend(future.result())
+                    n_succeeded += 1
+                except Exception:
+                    # A failing folder is reported but does not stop the rest of the batch
+                    self.failures.append({'Chip': job.chip_name, 'Measurement': job.measurement,
+                                          'Error': traceback.format_exc()})
+
+        results_directory = os.path.join(self.root_path, 'analysis_results')
+        os.makedirs(results_directory, exist_ok=True)
+
+        loss_rows.sort(key=lambda row: tuple(row[column] for column in BATCH_COLUMNS[:5]))
+        loss_csv_path = os.path.join(results_directory, 'batch_loss_data.csv')
+        write_csv(loss_rows, loss_csv_path, BATCH_COLUMNS)
+        print(f"Batch loss data for {n_succeeded} of {len(jobs)} jobs saved to {loss_csv_path}")
+
+        if self.failures:
+            failures_csv_path = os.path.join(results_directory, 'batch_failures.csv')
+            write_csv(self.failures, failures_csv_path, ['Chip', 'Measurement', 'Error'])
+            for failure in self.failures:
+                print(f"Failed {failure['Chip']}/{failure['Measurement']}: {failure['Error']}")
+            print(f"Failures saved to {failures_csv_path}")
+
+        return loss_rows, self.failures
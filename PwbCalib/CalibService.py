@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import asyncio
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from .BatchRunner import BatchRunner, run_job
+from .LossTable import make_calib
+
+
+class CalibService:
+    """Local asyncio HTTP service answering calibration queries from warm GraphCalib fits
+
+    Each measurement folder below root_path is parsed and fitted once and kept in memory, so a loss query is
+    answered in milliseconds; a measurement is reloaded when its sweeps, references or config.yaml change.
+    All GraphCalib work runs on one fitting thread, so the event loop stays free and the fits need no locks,
+    and PDF reports are built by Execute in a pool of worker processes.
+
+    GET  /health                                      service status
+    GET  /measurements                                chips and measurements found, and which are warm
+    GET  /loss?chip=&measurement=&wavelength=&channel=&bond=
+                                                      loss rows; all but chip are optional, the wavelength
+                                                      and channel default to the config.yaml devices
+    GET  /qc?chip=&measurement=                       QC rows of every sweep
+    POST /report?chip=&measurement=                   queue a PDF report, returns the job id
+    GET  /jobs/<id>                                   state of a report job and its PDF path
+    POST /rescan                                      look for new measurement folders
+    """
+
+    def __init__(self, root_path, host='127.0.0.1', port=8765, process='PWB', workers=None, cache_dir=None,
+                 qc=True, warm=True):
+        self.root_path = root_path
+        self.host = host  # Local only by default
+        self.port = port
+        self.process = process
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.qc = qc
+        self.warm = warm  # Load every measurement in the background at start-up
+
+        # BatchRunner provides the folder discovery and the report jobs
+        self.batch = BatchRunner(root_path, process=process, cache_dir=cache_dir, qc=qc)
+        self.measurements = {}  # (chip, measurement) -> BatchJob
+        self.calibs = {}  # (chip, measurement) -> (signature, GraphCalib, devices), touched by the fit thread only
+
+        self.fitter = None
+        self.pool = None
+        self.jobs = {}  # job id -> state of a report job
+        self.server = None
+
+    def scan(self):
+        """Find the measurement folders below root_path"""
+        self.batch.failures = []
+        self.measurements = {(job.chip_name, job.measurement): job for job in self.batch.make_jobs()}
+        for failure in self.batch.failures:
+            print(f"Skipped {failure['Chip']}/{failure['Measurement']}: {failure['Error']}")
+
+    async def find(self, chip, measurement=None):
+        """Keys of a chip's measurements, or of the one named; KeyError if there are none"""
+        if chip is None:
+            raise ValueError("chip is required")
+        keys = [key for key in self.measurements if key[0] == chip and measurement in (None, key[1])]
+        if not keys:
+            await self.fit(self.scan)  # The folder may have been created since the last scan
+            keys = [key for key in self.measurements if key[0] == chip and measurement in (None, key[1])]
+        if not keys:
+            raise KeyError(f"No measurement {chip}/{measurement or '*'}")
+        return sorted(keys)
+
+    # Fitting thread
+
+    def signature(self, calib):
+        """Size and modification time of every file the results depend on"""
+        file_paths = calib.reference_files() + [file_path for _, file_path in calib.iter_sweep_files()]
+        file_paths.append(os.path.join(calib.base_path, 'config.yaml'))
+        signature = []
+        for file_path in sorted(file_paths):
+            if os.path.exists(file_path):
+                stat = os.stat(file_path)
+                signature.append((file_path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load(self, key):
+        """Warm GraphCalib of a measurement, with every device channel fitted; reloaded if its files changed"""
+        if key in self.calibs:
+            signature, calib, devices = self.calibs[key]
+            if self.signature(calib) == signature:
+                return calib, devices
+
+        job = self.measurements[key]
+        calib, devices = make_calib(job.base_path, job.ref_file_path, cache_dir=self.cache_dir, qc=self.qc)
+        signature = self.signature(calib)
+        if not calib.prepare(devices):
+            raise ValueError(f"Error reading reference data {job.ref_file_path}")
+        for channel in dict.fromkeys(device['channel'] for device in devices):
+            calib.channel_results(channel)
+        self.calibs[key] = (signature, calib, devices)
+        return calib, devices
+
+    def loss_rows(self, keys, wavelength=None, channel=None, bond=None):
+        """Loss rows of the measurements at a wavelength, or at every config.yaml device
+
+        A channel without a wavelength is evaluated at the config.yaml wavelengths; ValueError if the reference
+        has no such channel. The fits are evaluated without storing the loss, so arbitrary wavelengths
+        do not accumulate in the warm SweepResults.
+        """
+        rows = []
+        for key in keys:
+            calib, devices = self.load(key)
+            if channel is not None and channel not in calib.reference.channels:
+                raise ValueError(f"Unknown channel {channel!r} in {key[0]}/{key[1]}, one of "
+                                 f"{', '.join(calib.reference.channels)}")
+            if wavelength is not None:
+                device_channels = [device['channel'] for device in devices if device['wavelength'] == wavelength]
+                devices = [{'wavelength': wavelength,
+                            'channel': channel or (device_channels or [devices[0]['channel']])[0]}]
+            elif channel is not None:
+                devices = [{'wavelength': device_wavelength, 'channel': channel}
+                           for device_wavelength in dict.fromkeys(device['wavelength'] for device in devices)]
+
+            for device in devices:
+                results = calib.channel_results(device['channel'])
+                for differentiating_number in calib.sorted_bonds(results):
+                    if bond is not None and int(differentiating_number) != bond:
+                        continue
+                    for result in results[differentiating_number]:
+                        loss_at_wavl = result.evaluate_loss(device['wavelength'], window=5)
+                        if loss_at_wavl is not None:
+                            rows.append({
+                                'Chip': key[0],
+                                'Measurement': key[1],
+                                'Wavelength (nm)': device['wavelength'],
+                                'Channel': device['channel'],
+                                'Bond': int(differentiating_number),
+                                'Loss (dB)': float(loss_at_wavl[0]),
+                                'Uncertainty (dB)': float(loss_at_wavl[1])
+                            })
+        return rows
+
+    def qc_rows(self, keys):
+        """QC rows of every sweep of the measurements"""
+        rows = []
+        for key in keys:
+            calib, _ = self.load(key)
+            rows.extend({'Chip': key[0], 'Measurement': key[1], **row} for row in calib.qc_report())
+        return rows
+
+    def warm_all(self):
+        """Load every measurement, so the first queries are answered from memory"""
+        for key in sorted(self.measurements):
+            try:
+                self.load(key)
+            except Exception as e:
+                print(f"Error loading {key[0]}/{key[1]}: {e}")
+
+    # Event loop
+
+    async def fit(self, function, *args):
+        """Run GraphCalib work on the fitting thread"""
+        return await asyncio.get_running_loop().run_in_executor(self.fitter, function, *args)
+
+    def number(self, params, name, kind=float):
+        """Optional numeric query parameter; ValueError if it is not a number"""
+        if params.get(name) is None:
+            return None
+        try:
+            return kind(params[name])
+        except ValueError:
+            raise ValueError(f"{name} must be a number, not {params[name]!r}")
+
+    async def health(self, params):
+        return HTTPStatus.OK, {'status': 'ok', 'measurements': len(self.measurements), 'warm': len(self.calibs)}
+
+    async def list_measurements(self, params):
+        return HTTPStatus.OK, {'measurements': [
+            {'chip': chip, 'measurement': measurement, 'base_path': job.base_path,
+             'measure_date': job.measure_date, 'warm': (chip, measurement) in self.calibs}
+            for (chip, measurement), job in sorted(self.measurements.items())]}
+
+    async def loss(self, params):
+        keys = await self.find(params.get('chip'), params.get('measurement'))
+        rows = await self.fit(self.loss_rows, keys, self.number(params, 'wavelength'), params.get('channel'),
+                              self.number(params, 'bond', int))
+        return HTTPStatus.OK, {'rows': rows}
+
+    async def qc_report(self, params):
+        keys = await self.find(params.get('chip'), params.get('measurement'))
+        return HTTPStatus.OK, {'rows': await self.fit(self.qc_rows, keys)}
+
+    async def rescan(self, params):
+        await self.fit(self.scan)
+        return await self.list_measurements(params)
+
+    async def report(self, params):
+        keys = await self.find(params.get('chip'), params.get('measurement'))
+        if len(keys) > 1:
+            raise ValueError(f"{params['chip']} has several measurements, give one of "
+                             f"{', '.join(key[1] for key in keys)}")
+        job = self.measurements[keys[0]]
+        job_id = str(len(self.jobs) + 1)
+        self.jobs[job_id] = {'id': job_id, 'chip': job.chip_name, 'measurement': job.measurement,
+                             'state': 'queued', 'submitted': time.time(), 'pdf_path': None, 'error': None}
+        asyncio.create_task(self.run_report(job_id, job))
+        return HTTPStatus.ACCEPTED, self.jobs[job_id]
+
+    async def run_report(self, job_id, job):
+        """Build the figures and PDF of a measurement in the worker pool and record the outcome"""
+        state = self.jobs[job_id]
+        state['state'] = 'running'
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.pool, run_job, job)
+        except Exception:
+            state['state'] = 'failed'
+            state['error'] = traceback.format_exc()
+        else:
+            state['state'] = 'done'
+            state['pdf_path'] = os.path.join(job.results_directory, f"{job.chip_name}_analysis_report.pdf")
+        state['finished'] = time.time()
+
+    async def job_state(self, job_id):
+        if job_id not in self.jobs:
+            raise KeyError(f"No job {job_id}")
+        return HTTPStatus.OK, self.jobs[job_id]
+
+    async def dispatch(self, method, target):
+        """Status and JSON payload for a request"""
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/measurements'): self.list_measurements,
+            ('GET', '/loss'): self.loss,
+            ('GET', '/qc'): self.qc_report,
+            ('POST', '/report'): self.report,
+            ('POST', '/rescan'): self.rescan,
+        }
+        try:
+            if method == 'GET' and url.path.startswith('/jobs/'):
+                return await self.job_state(url.path[len('/jobs/'):])
+            if (method, url.path) not in routes:
+                return HTTPStatus.NOT_FOUND, {'error': f"No route {method} {url.path}"}
+            return await routes[(method, url.path)](params)
+        except KeyError as e:
+            return HTTPStatus.NOT_FOUND, {'error': str(e.args[0]) if e.args else repr(e)}
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            traceback.print_exc()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(e)}
+
+    def respond(self, writer, status, payload, keep_alive, elapsed):
+        body = json.dumps(payload, default=str).encode()
+        headers = [f'HTTP/1.1 {status.value} {status.phrase}',
+                   'Content-Type: application/json',
+                   f'Content-Length: {len(body)}',
+                   f'Connection: {"keep-alive" if keep_alive else "close"}',
+                   f'X-Elapsed-Ms: {elapsed * 1000:.3f}']
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def handle(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one connection, keeping it open between requests"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length') or 0):
+                    await reader.readexactly(int(headers['content-length']))  # Parameters are in the query
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    self.respond(writer, HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line'}, False,
+                                 time.perf_counter() - start)
+                    await writer.drain()
+                    break
+                method, target, version = parts
+                status, payload = await self.dispatch(method, target)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                self.respond(writer, status, payload, keep_alive, time.perf_counter() - start)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    async def start(self):
+        """Open the pools and the listening socket; port 0 picks a free port, stored in self.port"""
+        self.fitter = ThreadPoolExecutor(max_workers=1)
+        # Spawned workers do not inherit the fitting thread's state
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        await self.fit(self.scan)
+
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Serving {len(self.measurements)} measurements from {self.root_path} on "
+              f"http://{self.host}:{self.port}")
+        if self.warm:
+            asyncio.get_running_loop().run_in_executor(self.fitter, self.warm_all)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.fitter.shutdown(wait=True)
+        self.pool.shutdown(wait=True)
+
+    async def serve(self):
+        """Serve until cancelled, i.e. by Ctrl+C"""
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Stopped")
@@ -0,0 +1,28 @@
+import os
+import yaml
+
+from .Reference import reference_csv
+
+
+def read_config(base_path):
+    """Contents of the config.yaml of a measurement folder, i.e. 01_Becky/1550_TE"""
+    yaml_file = os.path.join(base_path, 'config.yaml')
+    with open(yaml_file, 'r') as file:
+        return yaml.load(file, Loader=yaml.FullLoader) or {}
+
+
+def get_devices(config):
+    """Wavelength/channel pairs listed under 'devices'"""
+    return config['devices']
+
+
+def get_cutback(base_path, config):
+    """Reference files and their lengths (mm) from the 'cutback' section, or (None, None)
+
+    i.e. cutback: {ref_short_2_1: 0.5, ref_long_2_1: 2.0}
+    """
+    cutback = config.get('cutback')
+    if not cutback:
+        return None, None
+    ref_file_paths = [reference_csv(base_path, name) for name in cutback]
+    return ref_file_paths, [float(length) for length in cutback.values()]
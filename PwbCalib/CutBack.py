@@ -0,0 +1,94 @@
+import numpy as np
+
+from .Reference import Reference
+
+
+def cutback_fit(lengths, powers):
+    """Fit powers = intercept - propagation_loss * length at every point in one least-squares solve
+
+    powers is (n_lengths, n_points); every column is an independent straight-line fit sharing the same
+    design matrix, so the whole grid is solved at once. Returns the intercept (dBm), the propagation loss
+    (dB per length unit) and the RMS residual (dB), which is None with only two lengths.
+    """
+    lengths = np.asarray(lengths, dtype=np.float64)
+    if len(np.unique(lengths)) < 2:
+        raise ValueError("Cut-back needs references of at least two different lengths")
+
+    design = np.column_stack((np.ones_like(lengths), -lengths))
+    coeffs, residual_sum_of_squares, _, _ = np.linalg.lstsq(design, powers, rcond=None)
+
+    residual = None
+    if len(lengths) > 2:
+        residual = np.sqrt(residual_sum_of_squares / (len(lengths) - 2))
+    return coeffs[0], coeffs[1], residual
+
+
+class CutBack:
+    """Coupling and propagation loss fitted jointly from reference structures of several lengths
+
+    The zero-length intercept is the transmission through the grating couplers alone, so the reference it
+    gives is de-embedded from the reference waveguide's propagation loss.
+    """
+
+    def __init__(self, sweeps, lengths):
+        if len(sweeps) != len(lengths):
+            raise ValueError(f"Got {len(sweeps)} reference sweeps but {len(lengths)} lengths")
+
+        self.wavelength = sweeps[0].wavelength
+        self.lengths = np.asarray(lengths, dtype=np.float64)  # i.e. mm, as given in config.yaml
+        self.file_paths = [sweep.file_path for sweep in sweeps]
+        self.laser_power = self.read_laser_power(sweeps[0])
+
+        channels = [name for name in sweeps[0].channels if all(name in sweep for sweep in sweeps)]
+        n_points = len(self.wavelength)
+
+        # Every channel of every reference on the first grid, as one (n_lengths, n_channels * n_points) stack
+        powers = np.empty((len(sweeps), len(channels) * n_points))
+        for i, sweep in enumerate(sweeps):
+            same_grid = np.array_equal(sweep.wavelength, self.wavelength)
+            for j, name in enumerate(channels):
+                values = sweep[name] if same_grid else np.interp(self.wavelength, sweep.wavelength, sweep[name])
+                powers[i, j * n_points:(j + 1) * n_points] = values
+
+        intercept, propagation_loss, residual = cutback_fit(self.lengths, powers)
+
+        self.intercept = {}  # channel -> zero-length transmission (dBm)
+        self.propagation_loss = {}  # channel -> loss per unit length (dB)
+        self.residual = {}  # channel -> RMS residual of the fit (dB), None with two lengths
+        for j, name in enumerate(channels):
+            columns = slice(j * n_points, (j + 1) * n_points)
+            self.intercept[name] = intercept[columns]
+            self.propagation_loss[name] = propagation_loss[columns]
+            self.residual[name] = None if residual is None else residual[columns]
+
+    def read_laser_power(self, sweep):
+        """Laser power (dBm) from the sweep settings, i.e. 'Laser power: -2.7126 dBm', or None"""
+        try:
+            return float(sweep.header['Laser power'].split()[0])
+        except (KeyError, ValueError, IndexError):
+            return None
+
+    @property
+    def channels(self):
+        return list(self.intercept)
+
+    def coupling_loss(self, channel):
+        """Loss of both grating couplers together (dB), or None without the laser power in the header"""
+        if self.laser_power is None:
+            return None
+        return self.laser_power - self.intercept[channel]
+
+    def reference(self):
+        """De-embedded Reference: the zero-length transmission of every channel"""
+        return Reference(self.wavelength, self.intercept, self.file_paths)
+
+    def at(self, target_wavelength, channel):
+        """Propagation loss, coupling loss and fit residual of a channel at the target wavelength"""
+        propagation_loss = np.interp(target_wavelength, self.wavelength, self.propagation_loss[channel])
+        coupling_loss = self.coupling_loss(channel)
+        if coupling_loss is not None:
+            coupling_loss = np.interp(target_wavelength, self.wavelength, coupling_loss)
+        residual = self.residual[channel]
+        if residual is not None:
+            residual = np.interp(target_wavelength, self.wavelength, residual)
+        return propagation_loss, coupling_loss, residual
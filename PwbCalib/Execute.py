@@ -1,8 +1,5 @@
 import os
 import io
-import tempfile
-import yaml
-import pandas as pd
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -10,27 +7,54 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle,
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
 from datetime import datetime
-from PyPDF2 import PdfWriter, PdfReader
 
 from .GraphCalib import GraphCalib
+from .Config import read_config, get_devices, get_cutback
+from .Profiler import Profiler
+from .ResultsStore import ResultsStore
+from .SweepQC import QC_COLUMNS
+from .LossTable import write_csv
 
 class Execute:
-    def __init__(self, base_path, ref_file_path, chip_name, measure_date, process): #channel, #wavelength
+    def __init__(self, base_path, ref_file_path, chip_name, measure_date, process, results_directory=None,
+                 cache_dir=None, figure_workers=None, streaming=False,
+                 profile=False, cprofile=False, results_store=None, qc=True): #channel, #wavelength
         self.base_path = base_path
         self.ref_file_path = ref_file_path
         self.chip_name = chip_name
         self.measure_date = measure_date
         self.process = process
+        self.results_directory = results_directory
+        self.cache_dir = cache_dir
+        self.figure_workers = figure_workers
+        self.streaming = streaming
+        self.qc = qc  # Sweep QC before fitting, see GraphCalib
 
-    def get_data(self, calib):
-        # Analyze the data using GraphCalib's analyze_data method
-        figures_df, loss_df = calib.analyze_data()
+        self.profile = profile  # Write a JSON timing report, profile.json, with the results
+        self.cprofile = cprofile  # Also dump cProfile statistics to profile.prof
+        self.profiler = Profiler(enabled=False)
+
+        self.results_store = results_store  # SQLite file every run's losses are appended to
+        self.loss_rows = None  # Loss rows of the last run, with the sweep file of each
+
+    def get_results_directory(self):
+        """Directory the results are saved to, by default 'analysis_results' next to base_path"""
+        if self.results_directory:
+            return self.results_directory
 
         # Get the directory above base_path
         base_dir = os.path.dirname(self.base_path)
+        return os.path.join(base_dir, 'analysis_results')
+
+    def get_data(self, calib, devices=None):
+        # Analyze the data using GraphCalib, for every device if several are given
+        if devices:
+            figures_df, loss_df = calib.analyze_devices(devices)
+        else:
+            figures_df, loss_df = calib.analyze_data()
 
         # Define the directory path where results will be saved
-        results_directory = os.path.join(base_dir, 'analysis_results')
+        results_directory = self.get_results_directory()
 
         # Ensure that the 'analysis_results' directory exists
         os.makedirs(results_directory, exist_ok=True)
@@ -40,6 +64,33 @@ class Execute:
         loss_df.to_csv(loss_csv_path, index=False)
         print(f"Loss data saved to {loss_csv_path}")
 
+        # Save the cut-back fit at the device wavelengths when the references were de-embedded
+        if calib.cutback is not None:
+            cutback_csv_path = os.path.join(results_directory, 'cutback_data.csv')
+            calib.cutback_dataframe(devices or [{'wavelength': calib.wavelength, 'channel': calib.channel}]).to_csv(
+                cutback_csv_path, index=False)
+            print(f"Cut-back data saved to {cutback_csv_path}")
+
+        # Save the QC checks of every sweep, with the ones left out of the fits and why
+        qc_rows = calib.qc_report()
+        if qc_rows:
+            qc_csv_path = os.path.join(results_directory, 'qc_report.csv')
+            write_csv(qc_rows, qc_csv_path, QC_COLUMNS)
+            excluded = sum(1 for row in qc_rows if row['Excluded'])
+            print(f"QC report saved to {qc_csv_path} ({excluded} of {len(qc_rows)} sweeps excluded)")
+
+        # Save the fit coefficients and residual statistics of each channel, to evaluate the loss at any
+        # wavelength later with LossSpectrum.load(...).evaluate(...)
+        for channel in dict.fromkeys(device['channel'] for device in (devices or [{'channel': calib.channel}])):
+            model_path = os.path.join(results_directory, f'loss_model_{channel}.npz')
+            if not calib.channel_results(channel):
+                # Every sweep of the channel was excluded, or there are none; drop the model of an earlier run
+                if os.path.exists(model_path):
+                    os.remove(model_path)
+                print(f"No fitted sweeps for {channel}, no loss model saved")
+                continue
+            calib.loss_spectrum(channel).save(model_path)
+
         # Save figures to separate files
         for index, row in figures_df.iterrows():
             figure = row['Figure']
@@ -99,7 +150,7 @@ class Execute:
         results_df['Bond'] = results_df['Bond'].astype(int)
 
         table_data = [results_df.columns.tolist()] + results_df.values.tolist()
-        col_widths = [1.5 * inch, 1.5 * inch] # table
+        col_widths = [min(1.5, 6.5 / len(results_df.columns)) * inch] * len(results_df.columns) # table
 
         table = Table(table_data, colWidths=col_widths)
         table.setStyle(TableStyle([
@@ -123,12 +174,9 @@ class Execute:
 
             # Verify the type of figure to ensure it's a BytesIO object
             if isinstance(figure, io.BytesIO):
-                # Save the BytesIO object to a temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-                    tmp_file.write(figure.getvalue())
-                    tmp_file_path = tmp_file.name
-
-                img = Image(tmp_file_path, width=7.2 * inch, height=4.32 * inch)
+                # reportlab reads the PNG straight from the buffer, no temporary file needed
+                figure.seek(0)
+                img = Image(figure, width=7.2 * inch, height=4.32 * inch)
                 story.append(img)
 
                 if (i + 1) % figures_per_page == 0:
@@ -140,29 +188,69 @@ class Execute:
 
         return pdf_path
 
-    def genReport(self):
-        yaml_file = os.path.join(self.base_path, 'config.yaml')
-        with open(yaml_file, 'r') as file:
-            data = yaml.load(file, Loader=yaml.FullLoader)
-
-        # Extract the wavelength and channel from the YAML file
-        device = data['devices'][0]
-        wavelength = device['wavelength']
-        channel = device['channel']
-
-        calib = GraphCalib(self.base_path, self.ref_file_path, channel, wavelength)
-        figures_df, loss_df = self.get_data(calib)
+    def get_config(self):
+        """Contents of the config.yaml of the measurement folder"""
+        return read_config(self.base_path)
 
-        # Get the directory above base_path
-        base_dir = os.path.dirname(self.base_path)
+    def get_devices(self):
+        """Wavelength/channel pairs listed in the config.yaml of the measurement folder"""
+        return get_devices(self.get_config())
 
-        # Define the results directory path
-        results_directory = os.path.join(base_dir, 'analysis_results')
+    def get_cutback(self):
+        """Reference files and their lengths (mm) from the config.yaml 'cutback' section, or (None, None)"""
+        return get_cutback(self.base_path, self.get_config())
 
-        # Check if the results directory exists, create it if it doesn't
-        if not os.path.exists(results_directory):
-            os.makedirs(results_directory)
+    def make_profiler(self):
+        """Profiler for this run, writing the cProfile dump next to the results when requested"""
+        return Profiler.for_results(self.get_results_directory(), self.profile, self.cprofile)
 
-        # Generate the PDF report
-        pdf_path = self.pdfReport(results_directory, loss_df, figures_df)
-        print(f"PDF report generated at {pdf_path}")
+    def genReport(self):
+        self.profiler = self.make_profiler()
+        self.profiler.start()
+        # Stop cProfile even if the run fails, so it does not stay enabled in a batch worker
+        try:
+            # Extract every wavelength and channel from the YAML file; the sweeps are parsed once for all of them
+            devices = self.get_devices()
+            wavelength = devices[0]['wavelength']
+            channel = devices[0]['channel']
+
+            # Figures whose data did not change since the last run are reused from figure_cache
+            figure_cache_dir = os.path.join(self.get_results_directory(), 'figure_cache')
+            # With a 'cutback' section the reference is de-embedded from all the listed reference lengths
+            ref_file_path, ref_lengths = self.get_cutback()
+            if ref_file_path is None:
+                ref_file_path = self.ref_file_path
+
+            calib = GraphCalib(self.base_path, ref_file_path, channel, wavelength, cache_dir=self.cache_dir,
+                               figure_workers=self.figure_workers, figure_cache_dir=figure_cache_dir,
+                               streaming=self.streaming, ref_lengths=ref_lengths, profiler=self.profiler, qc=self.qc)
+            with self.profiler.stage('analyze'):
+                figures_df, loss_df = self.get_data(calib, devices)
+                self.loss_rows = calib.loss_table(devices)  # The fits are already evaluated, this only collects them
+
+            if self.results_store:
+                with self.profiler.stage('store'):
+                    ResultsStore(self.results_store).append(self.loss_rows, self.chip_name,
+                                                            os.path.basename(self.base_path), self.measure_date,
+                                                            self.process, ref_file_path)
+
+            # Define the results directory path
+            results_directory = self.get_results_directory()
+
+            # Check if the results directory exists, create it if it doesn't
+            if not os.path.exists(results_directory):
+                os.makedirs(results_directory)
+
+            # Generate the PDF report
+            with self.profiler.stage('pdf_report'):
+                pdf_path = self.pdfReport(results_directory, loss_df, figures_df)
+            print(f"PDF report generated at {pdf_path}")
+        finally:
+            self.profiler.stop()
+
+        if self.profiler.enabled:
+            profile_path = os.path.join(results_directory, 'profile.json')
+            self.profiler.write(profile_path)
+            print(f"Timing report saved to {profile_path}")
+
+        return loss_df, pdf_path
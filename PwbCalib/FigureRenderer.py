@@ -0,0 +1,155 @@
+import os
+import io
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Bump when render_figure changes how a spec is drawn, so cached PNGs are not reused
+FIGURE_VERSION = 1
+
+
+def minmax_indices(y, max_points):
+    """Indices keeping the minimum and maximum of y in each of max_points // 2 equal buckets, in order
+
+    Every extreme within a bucket survives, so the envelope of a noisy trace drawn at screen resolution
+    looks the same as the full trace. Returns all indices when y already fits in max_points.
+    """
+    n_points = len(y)
+    if max_points is None or n_points <= max_points:
+        return np.arange(n_points)
+
+    n_buckets = max(max_points // 2, 1)
+    bucket_size = -(-n_points // n_buckets)  # Ceiling division
+
+    # Pad the last bucket with its final value so the trace reshapes into (n_buckets, bucket_size)
+    padded = np.full(n_buckets * bucket_size, y[-1], dtype=float)
+    padded[:n_points] = y
+    buckets = padded.reshape(n_buckets, bucket_size)
+
+    starts = np.arange(n_buckets) * bucket_size
+    i_min = starts + np.argmin(buckets, axis=1)
+    i_max = starts + np.argmax(buckets, axis=1)
+
+    # Interleave so each bucket contributes its two extremes in x order
+    indices = np.empty(2 * n_buckets, dtype=int)
+    indices[0::2] = np.minimum(i_min, i_max)
+    indices[1::2] = np.maximum(i_min, i_max)
+    indices = np.minimum(indices, n_points - 1)
+
+    # Always keep the end points so the trace spans the full wavelength range
+    return np.unique(np.concatenate(([0], indices, [n_points - 1])))
+
+
+class FigureSpec:
+    """Plotting calls recorded against an Axes, so the figure can be drawn later in any process"""
+
+    def __init__(self, name, figsize=(10, 6)):
+        self.name = name
+        self.figsize = figsize
+        self.calls = []  # (Axes method, args, kwargs)
+
+    def record(self, method, *args, **kwargs):
+        self.calls.append((method, args, kwargs))
+
+    def plot(self, *args, **kwargs):
+        self.record('plot', *args, **kwargs)
+
+    def fill_between(self, *args, **kwargs):
+        self.record('fill_between', *args, **kwargs)
+
+    def errorbar(self, *args, **kwargs):
+        self.record('errorbar', *args, **kwargs)
+
+    def axhline(self, *args, **kwargs):
+        self.record('axhline', *args, **kwargs)
+
+    def set_xlabel(self, *args, **kwargs):
+        self.record('set_xlabel', *args, **kwargs)
+
+    def set_ylabel(self, *args, **kwargs):
+        self.record('set_ylabel', *args, **kwargs)
+
+    def set_title(self, *args, **kwargs):
+        self.record('set_title', *args, **kwargs)
+
+    def legend(self, *args, **kwargs):
+        self.record('legend', *args, **kwargs)
+
+    def digest(self):
+        """Hash of everything the figure is drawn from; equal digests give identical PNGs"""
+        sha = hashlib.sha1(repr((self.figsize, FIGURE_VERSION)).encode())
+        for method, args, kwargs in self.calls:
+            sha.update(method.encode())
+            for value in list(args) + [kwargs[key] for key in sorted(kwargs)]:
+                if isinstance(value, np.ndarray):
+                    sha.update(np.ascontiguousarray(value).tobytes())
+                else:
+                    sha.update(repr(value).encode())
+            sha.update(repr(sorted(kwargs)).encode())
+        return sha.hexdigest()
+
+
+def render_figure(spec):
+    """Draw a FigureSpec with the object-oriented Figure API and return the PNG bytes"""
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=spec.figsize)
+    axes = figure.subplots()
+    for method, args, kwargs in spec.calls:
+        getattr(axes, method)(*args, **kwargs)
+
+    img_buffer = io.BytesIO()
+    figure.savefig(img_buffer, format='png')
+    return img_buffer.getvalue()
+
+
+class FigureRenderer:
+    """Render FigureSpecs in a process pool, reusing the PNG of any figure whose inputs are unchanged"""
+
+    def __init__(self, workers=None, cache_dir=None):
+        self.workers = workers  # None uses every core, 1 renders in this process
+        self.cache_dir = cache_dir
+
+        self.rendered = 0  # Figures drawn so far
+        self.reused = 0  # Figures taken from the cache so far
+
+    def cache_path(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}.png')
+
+    def render(self, specs):
+        """PNG bytes of every spec, in the order given"""
+        digests = [spec.digest() for spec in specs]
+        images = [None] * len(specs)
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for i, digest in enumerate(digests):
+                if os.path.exists(self.cache_path(digest)):
+                    with open(self.cache_path(digest), 'rb') as file:
+                        images[i] = file.read()
+
+        missing = [i for i, image in enumerate(images) if image is None]
+        if len(missing) > 1 and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                rendered = list(pool.map(render_figure, [specs[i] for i in missing]))
+        else:
+            rendered = [render_figure(specs[i]) for i in missing]
+
+        for i, image in zip(missing, rendered):
+            images[i] = image
+        self.rendered += len(missing)
+        self.reused += len(specs) - len(missing)
+
+        if self.cache_dir:
+            for i in missing:
+                with open(self.cache_path(digests[i]), 'wb') as file:
+                    file.write(images[i])
+            self.prune(set(digests))
+
+        return images
+
+    def prune(self, digests):
+        """Keep only the figures of the latest run so the cache does not grow without bound"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.png') and name[:-len('.png')] not in digests:
+                os.remove(os.path.join(self.cache_dir, name))
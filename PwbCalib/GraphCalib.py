@@ -1,199 +1,341 @@
 import os
 import io
-import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
+from .SweepReader import SweepReader, preferred_sweep_file
+from .SweepCache import SweepCache
+from .SweepResult import SweepResult, RESIDUAL_BIN_WIDTH
+from .Reference import Reference
+from .CutBack import CutBack
+from .Profiler import Profiler
+from .LossSpectrum import LossSpectrum
+from .RunningStats import RunningStats
+from .SweepQC import SweepQC
+from .FigureRenderer import FigureSpec, FigureRenderer, minmax_indices
+
 class GraphCalib:
-    def __init__(self, base_path, ref_file_path, channel, wavelength):
+    def __init__(self, base_path, ref_file_path, channel, wavelength, cache_dir=None, use_mat=True,
+                 figure_workers=None, figure_cache_dir=None, max_plot_points=4000, streaming=False, ref_lengths=None,
+                 profiler=None, qc=True):
         self.base_path = base_path
-        self.ref_file_path = ref_file_path
+        self.ref_file_path = ref_file_path  # One reference file, or a list of files to average
+        self.ref_lengths = ref_lengths  # Length of each reference file to de-embed them by cut-back instead
         self.channel = channel
         self.wavelength = wavelength
 
-        self.figures_df = pd.DataFrame(columns=['Name', 'Figure'])
+        self.use_mat = use_mat  # Read the binary .mat next to each CSV when it exists
+
+        # Parsed sweeps are cached on disk when a cache directory is given
+        self.reader = SweepCache(cache_dir) if cache_dir else SweepReader()
+        self.reference = None
+        self.cutback = None
+        self.data_dict = None
+        self.results = {}
+        self.results_by_channel = {}
+        self.fit_stats_by_channel = {}  # channel -> (wavelength grid, RunningStats of the fitted curves)
+
+        # Streaming fits each sweep as it is read and keeps only its plotted envelope, about 6x less memory
+        self.streaming = streaming
+        self.streamed_devices = None
+        self.label_channel = False  # Add the channel to figure names when several channels are analyzed
+        self.figures_df = None  # Name/Figure DataFrame, created on the first render so pandas loads lazily
+
+        # Figures are recorded while analyzing and rendered together at the end, in parallel
+        self.pending_figures = []
+        self.renderer = FigureRenderer(workers=figure_workers, cache_dir=figure_cache_dir)
+        self.max_plot_points = max_plot_points  # Points kept per plotted trace, None plots every point
+
+        # Stage timers and counters, a disabled Profiler unless one is given
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+
+        # Sweep QC before fitting: True for the default SweepQC, a SweepQC to tune it, False to fit everything
+        self.qc = SweepQC() if qc is True else (qc or None)
+        self.qc_by_channel = {}  # channel -> QC report rows of every sweep
 
     def get_csv_files(self, folder_path):
         """Get list of CSV files in the folder"""
         return [f for f in os.listdir(folder_path) if f.endswith('.csv')]
 
+    def sweep_file(self, file_path):
+        """File to load a sweep CSV from: its .mat copy when present and readable, else the CSV"""
+        if self.use_mat:
+            return preferred_sweep_file(file_path)
+        return file_path
+
     def extract_number_from_folder(self, folder_name):
         """Extract the differentiating bond number from the folder name"""
         parts = folder_name.split('_')
         return parts[-2]  # Assuming the number is the second last element
 
     def read_csv(self, file_path):
-        """Read the CSV file and transpose it"""
+        """Read the sweep file (CSV or .mat) into float64 arrays keyed by row tag
+
+        A .mat file that cannot be read, i.e. truncated or still being written, falls back to the CSV next to it.
+        """
         try:
-            data = pd.read_csv(file_path, comment='#', header=None)
-            data = data.transpose()
-            data.columns = data.iloc[0]  # Set the first row as the header
-            data = data.drop(data.index[0])
-            return data
+            with self.profiler.stage('read'):
+                data = self.reader.read(file_path)
         except Exception as e:
-            print(f"Error reading and transposing file {file_path}: {e}")
+            csv_path = os.path.splitext(file_path)[0] + '.csv'
+            if file_path.endswith('.mat') and os.path.exists(csv_path):
+                print(f"Error reading file {file_path}: {e}, reading {csv_path} instead")
+                return self.read_csv(csv_path)
+            print(f"Error reading file {file_path}: {e}")
             return None
-
-    def save_plot_to_buffer(self, name):
-        """Save the current plot to a BytesIO buffer and append to figures_df"""
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png')
-        img_buffer.seek(0)
-        df_figures = pd.DataFrame([{'Name': name, 'Figure': img_buffer}])
+        self.profiler.count('files_read')
+        self.profiler.count('bytes_read', os.path.getsize(file_path))
+        return data
+
+    def figure_name(self, name):
+        """Figure name for the current wavelength (and channel), i.e. '1550_calibRaw'"""
+        if self.label_channel:
+            return f'{self.wavelength}_{self.channel}_{name}'
+        return f'{self.wavelength}_{name}'
+
+    def add_figure(self, figure):
+        """Queue a recorded figure to be rendered and appended to figures_df"""
+        self.pending_figures.append(figure)
+
+    def render_figures(self):
+        """Render the queued figures to PNG BytesIO buffers and append them to figures_df"""
+        import pandas as pd
+
+        if self.figures_df is None:
+            self.figures_df = pd.DataFrame(columns=['Name', 'Figure'])
+        if not self.pending_figures:
+            return
+        rendered, reused = self.renderer.rendered, self.renderer.reused
+        with self.profiler.stage('render'):
+            images = self.renderer.render(self.pending_figures)
+        self.profiler.count('figures_rendered', self.renderer.rendered - rendered)
+        self.profiler.count('figures_reused', self.renderer.reused - reused)
+        df_figures = pd.DataFrame([{'Name': figure.name, 'Figure': io.BytesIO(image)}
+                                   for figure, image in zip(self.pending_figures, images)])
         self.figures_df = pd.concat([self.figures_df, df_figures], ignore_index=True)
-        plt.close()  # Close the plot to avoid display overlap
-        # print(f"Added figure: {name}")  # Debugging statement
-        # print(self.figures_df)  # Debugging statement
-
-    def plot_raw_calibration_data(self, data_dict, ref_data):
-        plt.figure(figsize=(10, 6))
+        self.pending_figures = []
+
+    def bond_colors(self):
+        """Colors cycled through for the bonds, matplotlib's tab10"""
+        import matplotlib
+        return matplotlib.colormaps['tab10'].colors
+
+    def decimate(self, x, *ys):
+        """Thin traces to max_plot_points, keeping the min/max envelope of the first one"""
+        indices = minmax_indices(ys[0], self.max_plot_points)
+        return (x[indices],) + tuple(y[indices] for y in ys)
+
+    def sorted_bonds(self, results):
+        """Bond numbers of the results in ascending order"""
+        return sorted(results.keys(), key=lambda x: int(x))
+
+    def group_by_grid(self, sweeps):
+        """Split (bond, sweep) pairs into lists that share an identical wavelength grid"""
+        groups = []
+        for bond, data in sweeps:
+            for group in groups:
+                grid = group[0][1]['wavelength']
+                if np.array_equal(grid, data['wavelength']):
+                    group.append((bond, data))
+                    break
+            else:
+                groups.append([(bond, data)])
+        return groups
+
+    def passes_fine_align(self, channel, bond, data, qc_rows):
+        """False, with a QC row, for a sweep whose Fine Align did not pass; always True without QC"""
+        if self.qc is None or self.qc.fine_align_passed(data):
+            return True
+        qc_rows.append(self.qc.record(channel, bond, data.file_path, self.qc.fine_align(data),
+                                      excluded='Fine Align'))
+        return False
+
+    def screen_outliers(self, channel, sweep_results, checks, qc_rows):
+        """Drop the sweeps whose fitted curve is an outlier of the batch, adding a QC row for every sweep
+
+        checks holds the (Fine Align, floor fraction) of each result.
+        """
+        scores, outliers = self.qc.outliers(sweep_results)
+        for result, (fine_align, floor_fraction), score, outlier in zip(sweep_results, checks, scores, outliers):
+            qc_rows.append(self.qc.record(channel, result.bond, result.source, fine_align, floor_fraction, score,
+                                          'Outlier' if outlier else ''))
+        self.profiler.count('sweeps_excluded', sum(1 for row in qc_rows if row['Excluded']))
+        return [result for result, outlier in zip(sweep_results, outliers) if not outlier]
+
+    def compute_results(self, data_dict, reference):
+        """Compute the insertion loss and fit of every sweep once, keyed by bond number
+
+        With QC, floor points get no weight in the fits, and sweeps failing Fine Align, mostly at the floor
+        or whose fit is an outlier of the batch are left out; every sweep's checks go to qc_by_channel.
+        """
+        qc_rows = []
+        sweeps = [(differentiating_number, data)
+                  for differentiating_number in self.sorted_bonds(data_dict)
+                  for data in data_dict[differentiating_number]
+                  if self.passes_fine_align(self.channel, differentiating_number, data, qc_rows)]
+
+        sweep_results = []
+        checks = []
+        for group in self.group_by_grid(sweeps):
+            wavelength = group[0][1]['wavelength']
+            powers = np.stack([data[self.channel] for _, data in group])
+            valid = None
+            if self.qc is not None:
+                # Floor points of the whole group in one comparison
+                valid = self.qc.valid_points(powers, reference.interpolate(wavelength, self.channel))
+                floor_fractions = 1 - valid.mean(axis=1)
+                keep = self.qc.enough_points(valid)
+                for (bond, data), floor_fraction, kept in zip(group, floor_fractions, keep):
+                    if kept:
+                        checks.append((self.qc.fine_align(data), floor_fraction))
+                    else:
+                        qc_rows.append(self.qc.record(self.channel, bond, data.file_path, self.qc.fine_align(data),
+                                                      floor_fraction, excluded='Noise Floor'))
+                group = [sweep for sweep, kept in zip(group, keep) if kept]
+                powers, valid = powers[keep], valid[keep]
+                if not group:
+                    continue
+
+            bonds = [bond for bond, _ in group]
+            sources = [data.file_path for _, data in group]
+            if len(group) > 1:
+                # Sweeps on one laser configuration share a grid: fit them all as a single 2-D stack
+                sweep_results.extend(SweepResult.from_batch(bonds, wavelength, powers, reference, self.channel,
+                                                            sources=sources, valid=valid))
+            else:
+                sweep_results.append(
+                    SweepResult.from_sweep(bonds[0], wavelength, powers[0], reference, self.channel,
+                                           source=sources[0], valid=None if valid is None else valid[0]))
+
+        self.profiler.count('fits', len(sweep_results))
+
+        if self.qc is not None:
+            sweep_results = self.screen_outliers(self.channel, sweep_results, checks, qc_rows)
+            self.qc_by_channel[self.channel] = sorted(qc_rows, key=lambda row: row['Bond'])
+
+        results = {}
+        for result in sweep_results:
+            results.setdefault(result.bond, []).append(result)
+        return {bond: results[bond] for bond in self.sorted_bonds(results)}
+
+    def accumulate_fit(self, fit_stats, grid, result):
+        """Add a sweep's fitted curve to the running statistics, evaluated on the statistics grid"""
+        if len(result.wavelength) == len(grid) and np.array_equal(result.wavelength, grid):
+            fit_stats.update(result.poly_fit)
+        else:
+            fit_stats.update(np.polyval(result.poly_coeff, grid))
+
+    def fit_statistics(self, results):
+        """Running mean and standard deviation of the fitted curves on the first sweep's grid"""
+        fit_stats = RunningStats()
+        grid = None
+        for differentiating_number in self.sorted_bonds(results):
+            for result in results[differentiating_number]:
+                if grid is None:
+                    grid = result.wavelength
+                self.accumulate_fit(fit_stats, grid, result)
+        return grid, fit_stats
+
+    def plot_raw_calibration_data(self, results, ref_wavelength, ref_channel):
+        figure = FigureSpec(self.figure_name('calibRaw'))
 
         # Plot reference data
-        ref_wavelength = ref_data['wavelength'].astype(float)
-        ref_channel = ref_data[self.channel].astype(float)
-        plt.plot(ref_wavelength, ref_channel, label='Reference', color='black')
+        figure.plot(*self.decimate(ref_wavelength, ref_channel), label='Reference', color='black')
 
         # Generate a colormap
-        colormap = plt.get_cmap('tab10')
-        colors = colormap.colors
+        colors = self.bond_colors()
 
         # Sort the data by differentiating number and plot
-        for i, differentiating_number in enumerate(sorted(data_dict.keys(), key=lambda x: int(x))):
+        for i, differentiating_number in enumerate(self.sorted_bonds(results)):
             color = colors[i % len(colors)]  # Cycle through colors if there are more than 10 bonds
-            for data in data_dict[differentiating_number]:
-                dataset_wavelength = data['wavelength'].astype(float)
-                dataset_channel = data[self.channel].astype(float)
-                plt.plot(dataset_wavelength, dataset_channel, label=f'Bond_{differentiating_number}', color=color)
+            for result in results[differentiating_number]:
+                figure.plot(*self.decimate(result.wavelength, result.power), label=f'Bond_{differentiating_number}',
+                            color=color)
 
-        plt.xlabel('Wavelength (nm)')
-        plt.ylabel('Power (dBm)')
-        plt.title('Raw PWB Calibration Data')
-        plt.legend()
-        self.save_plot_to_buffer(f'{self.wavelength}_calibRaw')
+        figure.set_xlabel('Wavelength (nm)')
+        figure.set_ylabel('Power (dBm)')
+        figure.set_title('Raw PWB Calibration Data')
+        figure.legend()
+        self.add_figure(figure)
 
-    def plot_difference_data(self, data_dict, ref_wavelength, ref_channel):
-        plt.figure(figsize=(10, 6))
+    def plot_difference_data(self, results):
+        figure = FigureSpec(self.figure_name('calibLoss'))
 
         # Generate a colormap
-        colormap = plt.get_cmap('tab10')
-        colors = colormap.colors
+        colors = self.bond_colors()
 
         # Sort the data by bond number and plot the differences with unique colors
-        for i, differentiating_number in enumerate(sorted(data_dict.keys(), key=lambda x: int(x))):
+        for i, differentiating_number in enumerate(self.sorted_bonds(results)):
             color = colors[i % len(colors)]  # Cycle through colors if there are more than 10 bonds
-            for data in data_dict[differentiating_number]:
-                dataset_wavelength = data['wavelength'].astype(float)
-                dataset_channel = data[self.channel].astype(float)
-
-                # Interpolate reference data to match dataset wavelengths
-                ref_channel_interpolated = np.interp(dataset_wavelength, ref_wavelength, ref_channel)
+            for result in results[differentiating_number]:
+                figure.plot(*self.decimate(result.wavelength, result.insertion_loss),
+                            label=f'Bond_{differentiating_number}', color=color)
 
-                # Calculate the difference
-                difference = -(dataset_channel - ref_channel_interpolated)
+        figure.set_xlabel('Wavelength (nm)')
+        figure.set_ylabel('Insertion Loss (dB)')
+        figure.set_title('PWB Calibration Data Insertion Loss')
+        figure.legend()
+        self.add_figure(figure)
 
-                plt.plot(dataset_wavelength, difference, label=f'Bond_{differentiating_number}', color=color)
-
-        plt.xlabel('Wavelength (nm)')
-        plt.ylabel('Insertion Loss (dB)')
-        plt.title('PWB Calibration Data Insertion Loss')
-        plt.legend()
-        self.save_plot_to_buffer(f'{self.wavelength}_calibLoss')
-
-    def fitted_loss(self, data_dict, ref_wavelength, ref_channel):
+    def fitted_loss(self, results):
         # Second plot: All fitted data with average and standard deviation shaded area
-        plt.figure(figsize=(10, 6))
+        figure = FigureSpec(self.figure_name('fittedLoss'))
 
         # Generate a colormap
-        colormap = plt.get_cmap('tab10')
-        colors = colormap.colors
-
-        # Initialize lists to store all polynomial fits for calculating average and standard deviation
-        poly_fits = []
-        dataset_wavelength = None
+        colors = self.bond_colors()
 
         # Plot each fitted data in different colors with legend labels for bond numbers
-        for i, differentiating_number in enumerate(sorted(data_dict.keys(), key=lambda x: int(x))):
+        for i, differentiating_number in enumerate(self.sorted_bonds(results)):
             color = colors[i % len(colors)]  # Cycle through colors if there are more than 10 bonds
-            for data in data_dict[differentiating_number]:
-                dataset_wavelength = data['wavelength'].astype(float)
-                dataset_channel = data[self.channel].astype(float)
-
-                # Interpolate reference data to match dataset wavelengths
-                ref_channel_interpolated = np.interp(dataset_wavelength, ref_wavelength, ref_channel)
-
-                # Calculate the difference
-                difference = -(dataset_channel - ref_channel_interpolated)
-
-                # Fit the difference to a 4th degree polynomial
-                poly_coeff = np.polyfit(dataset_wavelength, difference, 4)
-                poly_fit = np.polyval(poly_coeff, dataset_wavelength)
+            for result in results[differentiating_number]:
+                # Plot the fitted data
+                figure.plot(*self.decimate(result.wavelength, result.poly_fit),
+                            label=f'Bond_{differentiating_number}', color=color, linestyle='-', alpha=0.5)
 
-                # Append the polynomial fit for later analysis
-                poly_fits.append(poly_fit)
+        # Average and standard deviation of the polynomial fits, accumulated without stacking them
+        if self.channel not in self.fit_stats_by_channel:
+            self.fit_stats_by_channel[self.channel] = self.fit_statistics(results)
+        dataset_wavelength, fit_stats = self.fit_stats_by_channel[self.channel]
 
-                # Plot the fitted data
-                plt.plot(dataset_wavelength, poly_fit, label=f'Bond_{differentiating_number}', color=color,
-                         linestyle='-', alpha=0.5)
+        if fit_stats.count:
+            avg_fit = fit_stats.mean
+            std_fit = fit_stats.std
 
-        # Calculate the average and standard deviation of the polynomial fits
-        if poly_fits:
-            poly_fits = np.array(poly_fits)
-            avg_fit = np.mean(poly_fits, axis=0)
-            std_fit = np.std(poly_fits, axis=0)
+            plot_wavelength, avg_fit, std_fit = self.decimate(dataset_wavelength, avg_fit, std_fit)
 
             # Plot average line
-            plt.plot(dataset_wavelength, avg_fit, label='Average Fitted Difference', color='black', linestyle='-')
+            figure.plot(plot_wavelength, avg_fit, label='Average Fitted Difference', color='black',
+                        linestyle='-')
 
             # Shade the area representing the standard deviation
-            plt.fill_between(dataset_wavelength, avg_fit - std_fit, avg_fit + std_fit, color='gray', alpha=0.2,
-                             label='±1 Std Dev')
+            figure.fill_between(plot_wavelength, avg_fit - std_fit, avg_fit + std_fit, color='gray', alpha=0.2,
+                                label='±1 Std Dev')
+
+        figure.set_xlabel('Wavelength (nm)')
+        figure.set_ylabel('Insertion Loss (dB)')
+        figure.set_title('Fitted PWB Calibration Data Insertion Loss with Average and Std Dev')
+        figure.legend()
+        self.add_figure(figure)
 
-        plt.xlabel('Wavelength (nm)')
-        plt.ylabel('Insertion Loss (dB)')
-        plt.title('Fitted PWB Calibration Data Insertion Loss with Average and Std Dev')
-        plt.legend()
-        self.save_plot_to_buffer(f'{self.wavelength}_fittedLoss')
-        plt.show()
+    def plot_difference_at_wavl(self, results):
+        import pandas as pd
 
-    def plot_difference_at_wavl(self, data_dict, ref_wavelength, ref_channel):
-        plt.figure(figsize=(10, 6))
+        figure = FigureSpec(self.figure_name('calibLossWAVL'))
 
         # Generate a colormap
-        colormap = plt.get_cmap('tab10')
-        colors = colormap.colors
+        colors = self.bond_colors()
 
         differences_at_wavl = []
         loss_data = []
 
         # Sort the data by differentiating number and plot the differences with unique colors
-        for i, differentiating_number in enumerate(sorted(data_dict.keys(), key=lambda x: int(x))):
+        for i, differentiating_number in enumerate(self.sorted_bonds(results)):
             color = colors[i % len(colors)]  # Cycle through colors if there are more than 10 bonds
-            for data in data_dict[differentiating_number]:
-                dataset_wavelength = data['wavelength'].astype(float)
-                dataset_channel = data[self.channel].astype(float)
-
-                # Interpolate reference data to match dataset wavelengths
-                ref_channel_interpolated = np.interp(dataset_wavelength, ref_wavelength, ref_channel)
-
-                # Calculate the difference
-                difference = -(dataset_channel - ref_channel_interpolated)
-
-                # Fit the difference to a 4th degree polynomial
-                poly_coeff = np.polyfit(dataset_wavelength, difference, 4)
-                poly_fit = np.polyval(poly_coeff, dataset_wavelength)
-
-                # Calculate the average difference at the target wavelength using the polynomial fit
-                wavl_range_mask = (dataset_wavelength >= (self.wavelength - 5)) & (
-                        dataset_wavelength <= (self.wavelength + 5))
-                if np.any(wavl_range_mask):
+            for result in results[differentiating_number]:
+                # Evaluate the stored fit at the target wavelength
+                loss_at_wavl = result.loss_at(self.wavelength)
+                if loss_at_wavl is not None:
                     target_wavelength = self.wavelength
-                    poly_diff_at_wavl = np.polyval(poly_coeff, target_wavelength)
-
-                    # Calculate uncertainty of the fit
-                    residuals = difference[wavl_range_mask] - poly_fit[wavl_range_mask]
-                    residual_sum_of_squares = np.sum(residuals ** 2)
-                    total_variance = residual_sum_of_squares / (len(residuals) - len(poly_coeff))
-                    uncertainty_at_wavl = np.sqrt(total_variance)
+                    poly_diff_at_wavl, uncertainty_at_wavl = loss_at_wavl
 
                     differences_at_wavl.append(
                         (int(differentiating_number), poly_diff_at_wavl, color, f'Bond_{differentiating_number}',
@@ -211,7 +353,7 @@ class GraphCalib:
             differences_at_wavl.sort(key=lambda x: x[0])  # Sort by bond number
             bonds, differences, colors, labels, uncertainties = zip(*differences_at_wavl)
             for bond, difference, color, label, uncertainty in zip(bonds, differences, colors, labels, uncertainties):
-                plt.errorbar(bond, difference, yerr=uncertainty, fmt='o', color=color, label=label)
+                figure.errorbar(bond, difference, yerr=uncertainty, fmt='o', color=color, label=label)
 
             # Calculate and plot the average difference and its uncertainty
             average_difference = np.mean(differences)
@@ -222,107 +364,337 @@ class GraphCalib:
             # Total uncertainty is the combination of standard deviation and SEM
             total_uncertainty = np.sqrt(std_deviation ** 2 + sem ** 2)
 
-            plt.axhline(y=average_difference, color='red', linestyle='--',
-                        label=f'Average: {average_difference:.2f} ± {total_uncertainty:.2f} dB')
+            figure.axhline(y=average_difference, color='red', linestyle='--',
+                           label=f'Average: {average_difference:.2f} ± {total_uncertainty:.2f} dB')
 
             print(
                 f"Average difference at {self.wavelength} nm: {average_difference:.2f} +/- {total_uncertainty:.2f} dB")
             print(f"Standard deviation: {std_deviation:.2f} dB")
             print(f"Standard error of the mean: {sem:.2f} dB")
 
-            plt.xlabel('Bond Number')
-            plt.ylabel(f'Insertion Loss at {self.wavelength} nm (dB)')
-            plt.title(f'PWB Calibration Data Insertion Loss at {self.wavelength} nm')
-            plt.legend()
+            figure.set_xlabel('Bond Number')
+            figure.set_ylabel(f'Insertion Loss at {self.wavelength} nm (dB)')
+            figure.set_title(f'PWB Calibration Data Insertion Loss at {self.wavelength} nm')
+            figure.legend()
         else:
             print(f"No data available at {self.wavelength} nm")
 
-        self.save_plot_to_buffer(f'{self.wavelength}_calibLossWAVL')
+        self.add_figure(figure)
 
-        loss_df = pd.DataFrame(loss_data)
+        loss_df = pd.DataFrame(loss_data, columns=['Bond', 'Loss (dB)', 'Uncertainty (dB)'])
         return self.figures_df, loss_df
 
-    def fit_orig(self, data_dict, ref_wavelength, ref_channel):
+    def plot_cutback(self):
+        figure = FigureSpec(self.figure_name('cutBack'))
+
+        wavelength = self.cutback.wavelength
+        figure.plot(*self.decimate(wavelength, self.cutback.propagation_loss[self.channel]),
+                    label='Propagation Loss (dB/mm)', color='black')
+
+        coupling_loss = self.cutback.coupling_loss(self.channel)
+        if coupling_loss is not None:
+            figure.plot(*self.decimate(wavelength, coupling_loss), label='Coupling Loss (dB)', color='tab:blue')
+
+        figure.set_xlabel('Wavelength (nm)')
+        figure.set_ylabel('Loss (dB, dB/mm)')
+        lengths = ', '.join(f'{length:g}' for length in self.cutback.lengths)
+        figure.set_title(f'Cut-back Fit of the References ({lengths} mm)')
+        figure.legend()
+        self.add_figure(figure)
+
+    def cutback_dataframe(self, devices):
+        """Propagation and coupling loss of the cut-back fit at every device wavelength"""
+        import pandas as pd
+
+        cutback_data = []
+        for device in devices:
+            propagation_loss, coupling_loss, residual = self.cutback.at(device['wavelength'], device['channel'])
+            cutback_data.append({
+                'Wavelength (nm)': device['wavelength'],
+                'Channel': device['channel'],
+                'Propagation Loss (dB/mm)': propagation_loss,
+                'Coupling Loss (dB)': coupling_loss,
+                'Residual (dB)': residual
+            })
+        return pd.DataFrame(cutback_data)
+
+    def fit_orig(self, results):
         # Generate a colormap
-        colormap = plt.get_cmap('tab10')
-        colors = colormap.colors
+        colors = self.bond_colors()
 
         # Sort the data by bond number
-        for i, differentiating_number in enumerate(sorted(data_dict.keys(), key=lambda x: int(x))):
+        for i, differentiating_number in enumerate(self.sorted_bonds(results)):
             color = colors[i % len(colors)]  # Cycle through colors if there are more than 10 bonds
-            for data in data_dict[differentiating_number]:
-                dataset_wavelength = data['wavelength'].astype(float)
-                dataset_channel = data[self.channel].astype(float)
-
-                # Interpolate reference data to match dataset wavelengths
-                ref_channel_interpolated = np.interp(dataset_wavelength, ref_wavelength, ref_channel)
-
-                # Calculate the loss
-                difference = -(dataset_channel - ref_channel_interpolated)
-
-                # Fit the difference to a 4th degree polynomial
-                poly_coeff = np.polyfit(dataset_wavelength, difference, 4)
-                poly_fit = np.polyval(poly_coeff, dataset_wavelength)
-
+            for result in results[differentiating_number]:
                 # Create a new plot for each bond number
-                plt.figure(figsize=(10, 6))
+                figure = FigureSpec(f'original_and_fitted_loss_bond_{differentiating_number}')
 
                 # Plot original data
-                plt.plot(dataset_wavelength, difference, label=f'Original Bond_{differentiating_number}', color=color,
-                         linestyle='-')
+                figure.plot(*self.decimate(result.wavelength, result.insertion_loss),
+                            label=f'Original Bond_{differentiating_number}', color=color, linestyle='-')
 
                 # Plot fitted data
-                plt.plot(dataset_wavelength, poly_fit, label=f'Fitted Bond_{differentiating_number}', color='black',
-                         linestyle='--', linewidth=2)
+                figure.plot(*self.decimate(result.wavelength, result.poly_fit),
+                            label=f'Fitted Bond_{differentiating_number}', color='black', linestyle='--', linewidth=2)
 
 
-                plt.xlabel('Wavelength (nm)')
-                plt.ylabel('Insertion Loss (dB)')
-                plt.title(f'Original and Fitted Data for Bond_{differentiating_number}')
-                plt.legend()
+                figure.set_xlabel('Wavelength (nm)')
+                figure.set_ylabel('Insertion Loss (dB)')
+                figure.set_title(f'Original and Fitted Data for Bond_{differentiating_number}')
+                figure.legend()
 
-                # Save the plot to buffer
-                # self.save_plot_to_buffer(f'original_and_fitted_loss_bond_{differentiating_number}')
-                plt.show()
+                # Queue the plot for rendering
+                self.add_figure(figure)
 
-    def analyze_data(self, verbose=False):
-        """Plot data from folders and reference file"""
-        # Read reference data
-        ref_data = self.read_csv(self.ref_file_path)
-        if ref_data is not None:
-            ref_wavelength = ref_data['wavelength'].astype(float)
-            ref_channel = ref_data[self.channel].astype(float)
-        else:
-            print("Error reading reference data.")
-            return None, None
-
-        # Collect all data
-        data_dict = {}
+    def iter_sweep_files(self):
+        """Bond number and sweep file of every calibration sweep in base_path"""
         for folder_name in os.listdir(self.base_path):
             folder_path = os.path.join(self.base_path, folder_name)
             if os.path.isdir(folder_path) and 'calibration_ST2ST' in folder_name:
                 csv_files = self.get_csv_files(folder_path)
                 differentiating_number = self.extract_number_from_folder(folder_name)
                 for csv_file in csv_files:
-                    file_path = os.path.join(folder_path, csv_file)
-                    data = self.read_csv(file_path)
-                    if data is not None:
-                        if differentiating_number not in data_dict:
-                            data_dict[differentiating_number] = []
-                        data_dict[differentiating_number].append(data)
+                    yield differentiating_number, self.sweep_file(os.path.join(folder_path, csv_file))
+
+    def reference_files(self):
+        """Sweep file of each reference to average"""
+        ref_file_paths = self.ref_file_path
+        if isinstance(ref_file_paths, str):
+            ref_file_paths = [ref_file_paths]
+        return [self.sweep_file(file_path) for file_path in ref_file_paths]
+
+    def load_reference(self):
+        """Read the reference sweeps into a Reference, averaged when there are several"""
+        ref_sweeps = []
+        for file_path in self.reference_files():
+            ref_data = self.read_csv(file_path)
+            if ref_data is None:
+                print("Error reading reference data.")
+                return False
+            ref_sweeps.append(ref_data)
+
+        with self.profiler.stage('reference'):
+            return self.make_reference(ref_sweeps)
+
+    def make_reference(self, ref_sweeps):
+        """Average the reference sweeps, or de-embed them by cut-back when their lengths are known"""
+        if self.ref_lengths is not None:
+            # Fit out the reference waveguide's propagation loss, leaving only the coupling
+            try:
+                self.cutback = CutBack(ref_sweeps, self.ref_lengths)
+            except ValueError as e:
+                print(f"Error fitting cut-back references: {e}")
+                return False
+            self.reference = self.cutback.reference()
+        else:
+            self.reference = Reference.average(ref_sweeps)
+        return True
 
-        # Plot raw calibration data with reference data
-        self.plot_raw_calibration_data(data_dict, ref_data)
-        # Plot difference data
-        self.plot_difference_data(data_dict, ref_wavelength, ref_channel)
+    def load_data(self):
+        """Read the reference and every calibration sweep once, with all of their channels"""
+        # Read reference data
+        if not self.load_reference():
+            return False
 
-        self.fitted_loss(data_dict,ref_wavelength,ref_channel)
+        # Collect all data
+        data_dict = {}
+        for differentiating_number, file_path in self.iter_sweep_files():
+            data = self.read_csv(file_path)
+            if data is not None:
+                if differentiating_number not in data_dict:
+                    data_dict[differentiating_number] = []
+                data_dict[differentiating_number].append(data)
+
+        self.data_dict = data_dict
+        self.results_by_channel = {}
+        self.fit_stats_by_channel = {}
+        self.qc_by_channel = {}
+        return True
+
+    def fit_sweep(self, channel, differentiating_number, data, qc_rows, checks):
+        """Screen one sweep for a channel and fit it on its points above the floor
+
+        Returns None, adding a QC row, if the sweep fails Fine Align or is mostly at the floor; otherwise its
+        (Fine Align, floor fraction) is appended to checks for the outlier screening. Without QC every point is fit.
+        """
+        if not self.passes_fine_align(channel, differentiating_number, data, qc_rows):
+            return None
 
-        if verbose:
-            self.fit_orig(data_dict, ref_wavelength, ref_channel)
+        valid = None
+        if self.qc is not None:
+            valid = self.qc.valid_points(data[channel], self.reference.interpolate(data['wavelength'], channel))
+            floor_fraction = 1 - valid.mean()
+            if not self.qc.enough_points(valid)[0]:
+                qc_rows.append(self.qc.record(channel, differentiating_number, data.file_path,
+                                              self.qc.fine_align(data), floor_fraction, excluded='Noise Floor'))
+                return None
+            checks.append((self.qc.fine_align(data), floor_fraction))
+
+        return SweepResult.from_sweep(differentiating_number, data['wavelength'], data[channel], self.reference,
+                                      channel, source=data.file_path, valid=valid)
+
+    def stream_results(self, devices):
+        """Fit every sweep as it is read for all devices, then release it
+
+        Only the losses at the device wavelengths, the fit coefficients and the plotted envelope of each
+        trace are kept. That takes about 6x less memory than reading every sweep, but it still grows with the
+        bond count, by up to a few max_plot_points envelopes per sweep. The outlier QC and the fit statistics
+        run once every sweep is fitted, from the coefficients.
+        """
+        if not self.load_reference():
+            return False
+
+        channels = list(dict.fromkeys(device['channel'] for device in devices))
+        sweep_results = {channel: [] for channel in channels}
+        checks = {channel: [] for channel in channels}
+        qc_by_channel = {channel: [] for channel in channels}
+        grid = None  # Wavelength grid of the first sweep, the fit statistics are evaluated on it
+
+        for differentiating_number, file_path in self.iter_sweep_files():
+            data = self.read_csv(file_path)
+            if data is None:
+                continue
+
+            for channel in channels:
+                with self.profiler.stage('fit'):
+                    result = self.fit_sweep(channel, differentiating_number, data, qc_by_channel[channel],
+                                            checks[channel])
+                    if result is None:
+                        continue
+                    if grid is None:
+                        grid = result.wavelength
+
+                    for device in devices:
+                        if device['channel'] == channel:
+                            result.loss_at(device['wavelength'])
+                    result.release(self.max_plot_points)
+                self.profiler.count('fits')
+
+                sweep_results[channel].append(result)
+            del data  # Nothing references the full sweep any more
+
+        self.results_by_channel = {}
+        self.fit_stats_by_channel = {}
+        for channel in channels:
+            kept = sweep_results[channel]
+            if self.qc is not None:
+                kept = self.screen_outliers(channel, kept, checks[channel], qc_by_channel[channel])
+                self.qc_by_channel[channel] = sorted(qc_by_channel[channel], key=lambda row: row['Bond'])
+
+            results = {}
+            fit_stats = RunningStats()
+            for result in kept:
+                results.setdefault(result.bond, []).append(result)
+                self.accumulate_fit(fit_stats, grid, result)
+            self.results_by_channel[channel] = {bond: results[bond] for bond in self.sorted_bonds(results)}
+            self.fit_stats_by_channel[channel] = (grid, fit_stats)
+        return True
+
+    def prepare(self, devices):
+        """Read the sweeps, or stream and fit them, for the devices; False if the reference cannot be read"""
+        if self.streaming:
+            # Streamed results keep only the device losses, so they are reused only for the same devices
+            if self.streamed_devices == devices:
+                return True
+            if not self.stream_results(devices):
+                return False
+            self.streamed_devices = devices
+            return True
+        return self.data_dict is not None or self.load_data()
+
+    def channel_results(self, channel):
+        """Results of every sweep for a channel; each channel is interpolated, subtracted and fitted once"""
+        if channel not in self.results_by_channel:
+            self.channel = channel
+            with self.profiler.stage('fit'):
+                self.results_by_channel[channel] = self.compute_results(self.data_dict, self.reference)
+        return self.results_by_channel[channel]
+
+    def loss_spectrum(self, channel, bin_width=RESIDUAL_BIN_WIDTH):
+        """LossSpectrum of a channel, to evaluate the loss of every sweep at any wavelengths without refitting"""
+        return LossSpectrum.from_results(self.channel_results(channel), channel, bin_width)
+
+    def qc_report(self):
+        """QC rows of every sweep of the fitted channels, as SweepQC.QC_COLUMNS"""
+        return [row for channel in self.qc_by_channel for row in self.qc_by_channel[channel]]
+
+    def loss_table(self, devices):
+        """Loss and uncertainty of every bond for every device as rows of plain values
+
+        The numbers-only path: nothing is plotted, and neither pandas nor matplotlib is imported.
+        """
+        if not self.prepare(devices):
+            return None
 
-        # Plot difference at wavelength and get loss dataframe
-        df_figures, loss_df = self.plot_difference_at_wavl(data_dict, ref_wavelength, ref_channel)
+        rows = []
+        for device in devices:
+            results = self.channel_results(device['channel'])
+            with self.profiler.stage('loss'):
+                for differentiating_number in self.sorted_bonds(results):
+                    for result in results[differentiating_number]:
+                        loss_at_wavl = result.loss_at(device['wavelength'])
+                        if loss_at_wavl is not None:
+                            rows.append({
+                                'Wavelength (nm)': device['wavelength'],
+                                'Channel': device['channel'],
+                                'Bond': int(differentiating_number),
+                                'Loss (dB)': float(loss_at_wavl[0]),
+                                'Uncertainty (dB)': float(loss_at_wavl[1]),
+                                'Source': result.source
+                            })
+        return rows
+
+    def analyze_devices(self, devices, verbose=False):
+        """Analyze every wavelength/channel pair in devices from a single parse of the sweep files"""
+        import pandas as pd
+
+        if not self.prepare(devices):
+            return None, None
 
-        # Return the dataframes with the figures and loss data
-        return self.figures_df, loss_df
\ No newline at end of file
+        self.label_channel = len({device['channel'] for device in devices}) > 1
+
+        loss_dfs = []
+        plotted_channels = set()
+        for device in devices:
+            self.wavelength = device['wavelength']
+            self.channel = device['channel']
+
+            ref_wavelength = self.reference.wavelength
+            ref_channel = self.reference[self.channel]
+
+            # Another wavelength of an already fitted channel only re-evaluates the fits
+            self.results = self.channel_results(self.channel)
+
+            # The full-spectrum plots do not depend on the target wavelength
+            if self.channel not in plotted_channels:
+                plotted_channels.add(self.channel)
+
+                with self.profiler.stage('plot'):
+                    # Plot raw calibration data with reference data
+                    self.plot_raw_calibration_data(self.results, ref_wavelength, ref_channel)
+                    # Plot difference data
+                    self.plot_difference_data(self.results)
+
+                    self.fitted_loss(self.results)
+
+                    if self.cutback is not None:
+                        self.plot_cutback()
+
+                    if verbose:
+                        self.fit_orig(self.results)
+
+            # Plot difference at wavelength and get loss dataframe
+            with self.profiler.stage('loss'):
+                df_figures, loss_df = self.plot_difference_at_wavl(self.results)
+            loss_df.insert(0, 'Channel', self.channel)
+            loss_df.insert(0, 'Wavelength (nm)', self.wavelength)
+            loss_dfs.append(loss_df)
+
+        self.render_figures()
+
+        # Return the dataframes with the figures and the combined loss data
+        return self.figures_df, pd.concat(loss_dfs, ignore_index=True)
+
+    def analyze_data(self, verbose=False):
+        """Plot data from folders and reference file"""
+        return self.analyze_devices([{'wavelength': self.wavelength, 'channel': self.channel}], verbose)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from .SweepResult import RESIDUAL_BIN_WIDTH
+
+
+class LossSpectrum:
+    """Per-sweep fit coefficients and binned residual statistics of one channel
+
+    Evaluates the loss and its uncertainty at any vector of wavelengths in one call, without the sweeps and
+    without refitting. The uncertainty is the residual standard deviation within +/- window nm as in
+    SweepResult.loss_at, with the window edges resolved to the bin width.
+    """
+
+    def __init__(self, bonds, poly_coeffs, bin_width, first_bin, residual_ssr, residual_counts, channel=None):
+        self.bonds = np.asarray(bonds, dtype=np.int64)  # One entry per sweep, a bond may have several
+        self.poly_coeffs = np.asarray(poly_coeffs, dtype=np.float64)  # (n_sweeps, degree + 1)
+        self.bin_width = float(bin_width)
+        self.first_bin = int(first_bin)  # Bin k covers [k * bin_width, (k + 1) * bin_width)
+        self.residual_ssr = np.asarray(residual_ssr, dtype=np.float64)  # (n_sweeps, n_bins)
+        self.residual_counts = np.asarray(residual_counts, dtype=np.int64)  # (n_sweeps, n_bins)
+        self.channel = channel
+
+    @classmethod
+    def from_results(cls, results, channel=None, bin_width=RESIDUAL_BIN_WIDTH):
+        """Collect the SweepResults of a channel, keyed by bond number, onto one common set of bins"""
+        sweeps = [(int(bond), result) for bond in sorted(results, key=int) for result in results[bond]]
+        if not sweeps:
+            raise ValueError("No sweep results to build a loss spectrum from")
+
+        profiles = [result.residual_profile(bin_width) for _, result in sweeps]
+        first_bin = min(first for first, _, _ in profiles)
+        n_bins = max(first + len(counts) for first, _, counts in profiles) - first_bin
+
+        residual_ssr = np.zeros((len(sweeps), n_bins))
+        residual_counts = np.zeros((len(sweeps), n_bins), dtype=np.int64)
+        for i, (first, ssr, counts) in enumerate(profiles):
+            start = first - first_bin
+            residual_ssr[i, start:start + len(ssr)] = ssr
+            residual_counts[i, start:start + len(counts)] = counts
+
+        poly_coeffs = np.stack([result.poly_coeff for _, result in sweeps])
+        return cls([bond for bond, _ in sweeps], poly_coeffs, bin_width, first_bin, residual_ssr, residual_counts,
+                   channel)
+
+    @property
+    def wavelength_range(self):
+        """First and last wavelength (nm) covered by the sweeps"""
+        covered = np.flatnonzero(self.residual_counts.sum(axis=0))
+        return ((self.first_bin + covered[0]) * self.bin_width, (self.first_bin + covered[-1] + 1) * self.bin_width)
+
+    def evaluate(self, wavelengths, window=5):
+        """Loss and uncertainty (dB) of every sweep at every wavelength, each (n_sweeps, n_wavelengths)
+
+        NaN where no sweep points lie within the window, as SweepResult.loss_at returns None there.
+        """
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=np.float64))
+        n_coeffs = self.poly_coeffs.shape[1]
+
+        # Every polynomial at every wavelength as one matrix product
+        loss = self.poly_coeffs @ np.vander(wavelengths, n_coeffs).T
+
+        # Window sums from cumulative sums over the bins
+        n_bins = self.residual_ssr.shape[1]
+        lower = np.clip(np.rint((wavelengths - window) / self.bin_width).astype(np.int64) - self.first_bin, 0, n_bins)
+        upper = np.clip(np.rint((wavelengths + window) / self.bin_width).astype(np.int64) - self.first_bin, 0, n_bins)
+        cumulative_ssr = np.concatenate((np.zeros((len(self.bonds), 1)), np.cumsum(self.residual_ssr, axis=1)), axis=1)
+        cumulative_counts = np.concatenate((np.zeros((len(self.bonds), 1), dtype=np.int64),
+                                            np.cumsum(self.residual_counts, axis=1)), axis=1)
+        ssr = cumulative_ssr[:, upper] - cumulative_ssr[:, lower]
+        counts = cumulative_counts[:, upper] - cumulative_counts[:, lower]
+
+        degrees_of_freedom = counts - n_coeffs
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uncertainty = np.where(degrees_of_freedom > 0, np.sqrt(ssr / degrees_of_freedom), np.nan)
+        loss = np.where(counts > 0, loss, np.nan)
+        return loss, uncertainty
+
+    def save(self, file_path):
+        """Store the coefficients and residual statistics, to evaluate later with LossSpectrum.load"""
+        np.savez_compressed(file_path, bonds=self.bonds, poly_coeffs=self.poly_coeffs, bin_width=self.bin_width,
+                            first_bin=self.first_bin, residual_ssr=self.residual_ssr,
+                            residual_counts=self.residual_counts, channel=np.array(self.channel or ''))
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            return cls(data['bonds'], data['poly_coeffs'], float(data['bin_width']), int(data['first_bin']),
+                       data['residual_ssr'], data['residual_counts'], str(data['channel']) or None)
+
+    def export(self, file_path, wavelengths, window=5):
+        """Write the loss and uncertainty matrices (sweeps x wavelengths) with their axes to a .npz file"""
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=np.float64))
+        loss, uncertainty = self.evaluate(wavelengths, window)
+        np.savez_compressed(file_path, wavelength=wavelengths, bond=self.bonds, loss=loss, uncertainty=uncertainty,
+                            channel=np.array(self.channel or ''))
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+
+class Profiler:
+    """Stage timers and counters for one analysis run, written out as a JSON timing report
+
+    A disabled profiler (the default) does nothing, so the pipeline can always call it.
+    Stage times are inclusive: an outer stage such as 'analyze' contains the stages run inside it.
+    """
+
+    def __init__(self, enabled=True, cprofile_path=None):
+        self.enabled = enabled
+        self.cprofile_path = cprofile_path  # Also dump cProfile statistics here when given
+
+        self.stages = {}  # name -> {'seconds': total, 'calls': count}
+        self.counters = {}  # name -> total, i.e. {'files_read': 9, 'bytes_read': 10350000}
+        self.started = None
+        self.start_time = None
+        self.total_seconds = None
+        self.cprofile = None
+
+    @classmethod
+    def for_results(cls, results_directory, profile=False, cprofile=False):
+        """Profiler for a run saving to results_directory, enabled by profile or cprofile
+
+        With cprofile the cProfile statistics are dumped to profile.prof there.
+        """
+        cprofile_path = None
+        if cprofile:
+            os.makedirs(results_directory, exist_ok=True)
+            cprofile_path = os.path.join(results_directory, 'profile.prof')
+        return cls(enabled=profile or cprofile, cprofile_path=cprofile_path)
+
+    def start(self):
+        """Start the wall clock, and cProfile if a dump path was given"""
+        if not self.enabled:
+            return
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.start_time = time.perf_counter()
+        if self.cprofile_path:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        """Stop the wall clock and write the cProfile dump"""
+        if not self.enabled or self.start_time is None:
+            return
+        self.total_seconds = time.perf_counter() - self.start_time
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+            self.cprofile = None
+
+    def stage(self, name):
+        """Context manager adding the time spent inside it to the named stage"""
+        if not self.enabled:
+            return nullcontext()
+        return self.timed(name)
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+
+    def count(self, name, amount=1):
+        """Add amount to the named counter"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        """Timing report as a JSON serializable dictionary"""
+        return {
+            'started': self.started,
+            'total_seconds': self.total_seconds,
+            'stages': self.stages,
+            'counters': self.counters,
+            'cprofile': self.cprofile_path
+        }
+
+    def write(self, path):
+        """Write the timing report to a JSON file"""
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=1)
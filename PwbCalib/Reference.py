@@ -0,0 +1,100 @@
+import os
+import numpy as np
+
+
+def read_only(values):
+    """Contiguous float64 copy of values that cannot be modified in place"""
+    values = np.array(values, dtype=np.float64)
+    values.setflags(write=False)
+    return values
+
+
+def reference_csv(base_path, reference):
+    """CSV of a reference folder in base_path, i.e. ref_long_2_1, or the reference path itself if it is a file"""
+    ref_path = os.path.join(base_path, reference)
+    if os.path.isdir(ref_path):
+        csv_files = sorted(f for f in os.listdir(ref_path) if f.endswith('.csv'))
+        if not csv_files:
+            raise FileNotFoundError(f"No CSV file in reference folder {ref_path}")
+        ref_path = os.path.join(ref_path, csv_files[0])
+    return ref_path
+
+
+def grid_key(wavelength):
+    """Identify a uniform laser sweep grid by its start, step and length"""
+    n_points = len(wavelength)
+    start = float(wavelength[0])
+    step = (float(wavelength[-1]) - start) / (n_points - 1) if n_points > 1 else 0.0
+    # Rounded so the CSV (4 decimals) and .mat (full precision) copies of one grid share a key
+    return round(start, 6), round(step, 9), n_points
+
+
+class Reference:
+    """Reference spectrum loaded once, interpolated once per distinct sweep grid
+
+    The arrays are read-only, so the interpolated channels can be shared by every sweep on the same grid.
+    """
+
+    def __init__(self, wavelength, rows, file_paths=()):
+        self._wavelength = read_only(wavelength)
+        self._rows = {name: read_only(values) for name, values in rows.items()}
+        self.file_paths = tuple(file_paths)
+
+        self._interpolated = {}  # (channel, grid start, grid step, grid length) -> reference on that grid
+
+    @classmethod
+    def from_sweep(cls, sweep):
+        """Reference from a single Sweep"""
+        rows = {name: sweep[name] for name in sweep.channels}
+        return cls(sweep.wavelength, rows, [sweep.file_path])
+
+    @classmethod
+    def average(cls, sweeps):
+        """Average the channels of several reference sweeps, i.e. ref_short_* and ref_long_*, in one pass
+
+        The other sweeps are interpolated onto the grid of the first, and only channels present in every
+        sweep are kept. Powers are averaged in dBm.
+        """
+        sweeps = list(sweeps)
+        if not sweeps:
+            raise ValueError("At least one reference sweep is needed")
+        if len(sweeps) == 1:
+            return cls.from_sweep(sweeps[0])
+
+        wavelength = sweeps[0].wavelength
+        channels = [name for name in sweeps[0].channels if all(name in sweep for sweep in sweeps)]
+        totals = {name: np.zeros(len(wavelength)) for name in channels}
+
+        for sweep in sweeps:
+            same_grid = np.array_equal(sweep.wavelength, wavelength)
+            for name in channels:
+                if same_grid:
+                    totals[name] += sweep[name]
+                else:
+                    totals[name] += np.interp(wavelength, sweep.wavelength, sweep[name])
+
+        rows = {name: total / len(sweeps) for name, total in totals.items()}
+        return cls(wavelength, rows, [sweep.file_path for sweep in sweeps])
+
+    @property
+    def wavelength(self):
+        return self._wavelength
+
+    @property
+    def channels(self):
+        return list(self._rows)
+
+    def __getitem__(self, channel):
+        return self._rows[channel]
+
+    def __contains__(self, channel):
+        return channel in self._rows
+
+    def interpolate(self, wavelength, channel):
+        """Reference channel on the sweep's wavelength grid, computed once per grid"""
+        key = (channel,) + grid_key(wavelength)
+        values = self._interpolated.get(key)
+        if values is None:
+            values = read_only(np.interp(wavelength, self._wavelength, self._rows[channel]))
+            self._interpolated[key] = values
+        return values
@@ -0,0 +1,161 @@
+import os
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    chip TEXT NOT NULL,
+    measurement TEXT,
+    measure_date TEXT,
+    process TEXT,
+    reference TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS losses (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    wavelength REAL NOT NULL,
+    channel TEXT NOT NULL,
+    bond INTEGER NOT NULL,
+    loss REAL NOT NULL,
+    uncertainty REAL,
+    source_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_chip_date ON runs (chip, measure_date);
+CREATE INDEX IF NOT EXISTS runs_date ON runs (measure_date);
+CREATE INDEX IF NOT EXISTS losses_run ON losses (run_id);
+CREATE INDEX IF NOT EXISTS losses_device ON losses (wavelength, channel);
+CREATE VIEW IF NOT EXISTS loss_history AS
+    SELECT runs.run_id, chip, measurement, measure_date, process, reference, created,
+           wavelength, channel, bond, loss, uncertainty, source_hash
+    FROM losses JOIN runs USING (run_id);
+'''
+
+# Rows are never changed once written; a re-analysis is a new run
+APPEND_ONLY = '''
+CREATE TRIGGER IF NOT EXISTS {table}_no_update BEFORE UPDATE ON {table}
+BEGIN SELECT RAISE(ABORT, '{table} is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS {table}_no_delete BEFORE DELETE ON {table}
+BEGIN SELECT RAISE(ABORT, '{table} is append-only'); END;
+'''
+
+
+def file_hash(file_path):
+    """SHA-1 of a file's contents, so a result can be traced to the exact sweep it came from"""
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ResultsStore:
+    """Append-only SQLite table of bond losses across chips, dates and runs
+
+    Each analysis appends a run (chip, measurement, date, process, reference) and its loss rows, so results
+    are never overwritten and trends can be queried without re-running the analysis.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.hashes = {}  # (path, mtime_ns, size) -> content hash, so a sweep is hashed once per store
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+            for table in ('runs', 'losses'):
+                connection.executescript(APPEND_ONLY.format(table=table))
+
+    @contextmanager
+    def connect(self):
+        """Connection committed on success, rolled back on error, and always closed"""
+        # Batch workers may append at the same time; wait for the write lock instead of failing
+        connection = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def source_hash(self, file_path):
+        """Content hash of a sweep's CSV, also when its .mat copy was read, or None if it is unknown or gone
+
+        The CSV is always hashed so a sweep has the same hash in report and --numbers runs.
+        """
+        if not file_path:
+            return None
+        csv_path = os.path.splitext(file_path)[0] + '.csv'
+        if os.path.exists(csv_path):
+            file_path = csv_path
+        elif not os.path.exists(file_path):
+            return None
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        if key not in self.hashes:
+            self.hashes[key] = file_hash(file_path)
+        return self.hashes[key]
+
+    def append(self, rows, chip, measurement=None, measure_date=None, process=None, reference=None):
+        """Append a run and its loss rows, as from GraphCalib.loss_table, in one transaction; returns the run_id
+
+        reference is a file path or a list of them, stored as their folder names, i.e. 'ref_long_2_1'.
+        """
+        if reference is not None and not isinstance(reference, str):
+            reference = ';'.join(os.path.basename(os.path.dirname(path)) for path in reference)
+        elif reference is not None:
+            reference = os.path.basename(os.path.dirname(reference))
+
+        loss_rows = [(float(row['Wavelength (nm)']), row['Channel'], int(row['Bond']), float(row['Loss (dB)']),
+                      None if row.get('Uncertainty (dB)') is None else float(row['Uncertainty (dB)']),
+                      self.source_hash(row.get('Source')))
+                     for row in rows]
+
+        with self.connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (chip, measurement, measure_date, process, reference, created) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (chip, measurement, measure_date, process, reference, datetime.now().isoformat(timespec='seconds')))
+            run_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO losses (run_id, wavelength, channel, bond, loss, uncertainty, source_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id,) + row for row in loss_rows])
+        return run_id
+
+    def select(self, sql, parameters=()):
+        """Rows of a query as dictionaries keyed by column name"""
+        with self.connect() as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, parameters)]
+
+    def where(self, chip=None, wavelength=None, channel=None, since=None, until=None):
+        """SQL conditions and parameters for the given filters; dates are 'YYYY-MM-DD' and inclusive"""
+        conditions = []
+        parameters = []
+        for column, operator, value in (('chip', '=', chip), ('wavelength', '=', wavelength),
+                                        ('channel', '=', channel), ('measure_date', '>=', since),
+                                        ('measure_date', '<=', until)):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                parameters.append(value)
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    def query(self, chip=None, wavelength=None, channel=None, since=None, until=None):
+        """Every stored loss row matching the filters, oldest run first"""
+        where, parameters = self.where(chip, wavelength, channel, since, until)
+        return self.select(f'SELECT * FROM loss_history{where} ORDER BY run_id, wavelength, channel, bond',
+                           parameters)
+
+    def trend(self, wavelength=None, channel=None, chip=None, since=None, until=None):
+        """Bond count, mean and standard deviation of the loss per run and device, aggregated in SQLite"""
+        where, parameters = self.where(chip, wavelength, channel, since, until)
+        rows = self.select(
+            'SELECT run_id, chip, measurement, measure_date, process, reference, wavelength, channel, '
+            'COUNT(*) AS bonds, AVG(loss) AS mean_loss, AVG(loss * loss) - AVG(loss) * AVG(loss) AS variance '
+            f'FROM loss_history{where} GROUP BY run_id, wavelength, channel '
+            'ORDER BY measure_date, run_id, wavelength, channel', parameters)
+        for row in rows:
+            row['std_loss'] = max(row.pop('variance'), 0.0) ** 0.5  # Population standard deviation
+        return rows
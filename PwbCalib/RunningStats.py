@@ -0,0 +1,32 @@
+import numpy as np
+
+
+class RunningStats:
+    """Welford running mean and standard deviation of equal-length arrays, without keeping the arrays"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None  # Sum of squared differences from the running mean
+
+    def update(self, values):
+        """Add one array, i.e. one sweep's fitted curve"""
+        values = np.asarray(values, dtype=np.float64)
+        self.count += 1
+        if self.mean is None:
+            self.mean = values.copy()
+            self.m2 = np.zeros_like(self.mean)
+            return
+
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    @property
+    def variance(self):
+        """Population variance, as np.var with the default ddof=0"""
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from .SweepReader import Sweep, SweepReader
+
+
+class SweepCache:
+    """Parsed sweeps stored as .npz files, keyed by source path, mtime and size, with LRU eviction"""
+
+    def __init__(self, cache_dir, max_bytes=1e9, reader=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.reader = reader if reader is not None else SweepReader()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, file_path):
+        """Cache key of a sweep file; editing or replacing the file changes the key"""
+        stat = os.stat(file_path)
+        identity = f'{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}'
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def get(self, file_path):
+        """Cached Sweep for the file, or None if it has not been cached since it last changed"""
+        entry_path = self.entry_path(self.key(file_path))
+        try:
+            with np.load(entry_path) as entry:
+                header = json.loads(str(entry['__header__']))
+                rows = {name: entry[name] for name in entry['__rows__']}
+        except (OSError, KeyError, ValueError):
+            return None  # Missing, evicted by another process or partially written
+
+        # Mark the entry as recently used for the LRU eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass  # Evicted by another process since it was loaded; the loaded sweep is still good
+        return Sweep(file_path, header, rows)
+
+    def put(self, sweep):
+        """Store a parsed sweep and evict the least recently used entries beyond max_bytes
+
+        The cache is best-effort: returns False, leaving no partial entry behind, if it cannot be written,
+        i.e. the disk is full or the cache directory is read-only.
+        """
+        entry_path = self.entry_path(self.key(sweep.file_path))
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, __header__=np.array(json.dumps(sweep.header)), __rows__=np.array(list(sweep.rows)),
+                         **sweep.rows)
+            os.replace(tmp_path, entry_path)  # Readers never see a half written entry
+            self.evict()
+        except OSError as e:
+            print(f"Could not cache {sweep.file_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def read(self, file_path):
+        """Read a sweep from the cache, parsing and caching the file on a miss; a failed put still returns it"""
+        sweep = self.get(file_path)
+        if sweep is None:
+            sweep = self.reader.read(file_path)
+            self.put(sweep)
+        return sweep
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        """Remove every cached sweep"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,91 @@
+import numpy as np
+
+QC_COLUMNS = ['Channel', 'Bond', 'Source', 'Fine Align', 'Floor Points (%)', 'Outlier Score', 'Excluded']
+
+
+class SweepQC:
+    """Automatic quality control of the calibration sweeps before they are fitted
+
+    Flags detector-floor points, whose weight in the fit is set to zero, and excludes whole sweeps whose
+    '# Fine Align' header did not pass, that are mostly floor, or whose fitted curve is an outlier of the batch.
+    Every check works on whole arrays, one per batch of sweeps.
+    """
+
+    def __init__(self, noise_floor=-72.0, min_valid_fraction=0.5, outlier_threshold=3.5, outlier_points=256,
+                 outlier_min_distance=1.0, outlier_min_sweeps=10):
+        self.noise_floor = noise_floor  # dBm, the detector floor dropouts sit at about -73 to -80 dBm
+        self.min_valid_fraction = min_valid_fraction  # Sweeps with fewer points above the floor are excluded
+        self.outlier_threshold = outlier_threshold  # Robust z-score of a sweep's distance to the batch median
+        self.outlier_points = outlier_points  # Wavelengths the fitted curves are compared at
+        # An outlier must also be this far (dB) from the median shape, and the batch this large, to be excluded;
+        # smaller batches only get their scores reported
+        self.outlier_min_distance = outlier_min_distance
+        self.outlier_min_sweeps = outlier_min_sweeps
+
+    def fine_align(self, sweep):
+        """Fine Align status from the sweep header, 'Passed' when the header does not record it"""
+        return (getattr(sweep, 'header', None) or {}).get('Fine Align', 'Passed')
+
+    def fine_align_passed(self, sweep):
+        return self.fine_align(sweep).lower().startswith('pass')
+
+    def valid_points(self, powers, reference_power):
+        """Mask of the points above the noise floor in both the sweeps and the reference, same shape as powers"""
+        return (np.asarray(powers) > self.noise_floor) & (np.asarray(reference_power) > self.noise_floor)
+
+    def enough_points(self, valid):
+        """Which rows of a (n_sweeps, n_points) mask keep at least min_valid_fraction of their points"""
+        return np.mean(np.atleast_2d(valid), axis=1) >= self.min_valid_fraction
+
+    def shape_distances(self, poly_coeffs, wavelength_range):
+        """Median distance (dB) of each fitted curve's shape to the batch median shape, one per row of poly_coeffs
+
+        The curves are evaluated on a common grid in one matrix product and their median offsets removed, so
+        a bond that is uniformly lossier is not far from the batch, only one whose spectrum has a different shape.
+        """
+        poly_coeffs = np.atleast_2d(poly_coeffs)
+        grid = np.linspace(wavelength_range[0], wavelength_range[1], self.outlier_points)
+        curves = poly_coeffs @ np.vander(grid, poly_coeffs.shape[1]).T
+        shapes = curves - np.median(curves, axis=1, keepdims=True)
+        return np.median(np.abs(shapes - np.median(shapes, axis=0)), axis=1)
+
+    def outlier_scores(self, distance):
+        """Robust z-score of each shape distance against the batch, scored by its median absolute deviation"""
+        distance = np.asarray(distance)
+        if len(distance) < 3:
+            return np.zeros(len(distance))  # Too few sweeps for a batch median to mean anything
+
+        center = np.median(distance)
+        spread = 1.4826 * np.median(np.abs(distance - center))  # MAD scaled to a normal standard deviation
+        if spread == 0:
+            return np.zeros(len(distance))
+        return (distance - center) / spread
+
+    def outliers(self, results):
+        """Outlier scores of a list of SweepResults and a mask of those to exclude
+
+        A sweep is excluded when its score is above the threshold (one-sided), its shape is at least
+        outlier_min_distance dB from the batch median, and the batch has at least outlier_min_sweeps sweeps.
+        """
+        if not results:
+            return np.zeros(0), np.zeros(0, dtype=bool)
+        wavelength_range = (max(result.wavelength.min() for result in results),
+                            min(result.wavelength.max() for result in results))
+        distance = self.shape_distances(np.stack([result.poly_coeff for result in results]), wavelength_range)
+        scores = self.outlier_scores(distance)
+        excluded = (scores > self.outlier_threshold) & (distance >= self.outlier_min_distance)
+        if len(results) < self.outlier_min_sweeps:
+            excluded[:] = False
+        return scores, excluded
+
+    def record(self, channel, bond, source, fine_align, floor_fraction=None, outlier_score=None, excluded=''):
+        """One row of the QC report, excluded naming the check that left the sweep out of the fits"""
+        return {
+            'Channel': channel,
+            'Bond': int(bond),
+            'Source': source,
+            'Fine Align': fine_align,
+            'Floor Points (%)': None if floor_fraction is None else round(100 * float(floor_fraction), 2),
+            'Outlier Score': None if outlier_score is None else round(float(outlier_score), 2),
+            'Excluded': excluded
+        }
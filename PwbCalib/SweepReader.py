@@ -0,0 +1,119 @@
+import os
+import importlib.util
+import numpy as np
+
+# The .mat backend is optional, sweeps are then read from the CSV files. scipy is only imported on the
+# first .mat read so numbers-only runs start quickly.
+MAT_SUPPORT = importlib.util.find_spec('scipy') is not None
+
+
+def preferred_sweep_file(file_path):
+    """The binary .mat copy of a sweep CSV when it exists and scipy is installed, else the CSV itself
+
+    The .mat file is not opened here; GraphCalib.read_csv falls back to the CSV if it cannot be read.
+    """
+    mat_path = os.path.splitext(file_path)[0] + '.mat'
+    if MAT_SUPPORT and os.path.exists(mat_path):
+        return mat_path
+    return file_path
+
+
+class Sweep:
+    def __init__(self, file_path, header, rows):
+        self.file_path = file_path
+        self.header = header  # Metadata from the '#' lines, i.e. {'Fine Align': 'Passed', ...}
+        self.rows = rows  # Row tag -> contiguous float64 array, i.e. {'wavelength': ..., 'channel_1': ...}
+
+    def __getitem__(self, name):
+        return self.rows[name]
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    @property
+    def wavelength(self):
+        return self.rows['wavelength']
+
+    @property
+    def channels(self):
+        """Names of the channel rows in the sweep"""
+        return [name for name in self.rows if name != 'wavelength']
+
+
+class SweepReader:
+    """Parse Scylla sweep files straight into NumPy arrays"""
+
+    def read_header_line(self, line, header):
+        """Add a '# Key:<tab>value' metadata line to the header dictionary"""
+        text = line.lstrip('#').strip()
+        if ':' not in text:
+            return  # i.e. '#Metric Tag, value [, value]'
+        key, value = text.split(':', 1)
+        header[key.strip()] = value.strip()
+
+    def read_row(self, line):
+        """Split a 'tag,v1,v2,...' data row into its tag and a float64 array"""
+        tag, values = line.split(',', 1)
+        return tag.strip(), np.fromstring(values, dtype=np.float64, sep=',')
+
+    def read_header(self, file_path):
+        """Read only the '#' metadata lines at the top of a sweep file"""
+        header = {}
+        with open(file_path, 'r') as file:
+            for line in file:
+                if not line.startswith('#'):
+                    break
+                self.read_header_line(line, header)
+        return header
+
+    def read(self, file_path):
+        """Read a .mat or CSV sweep file into a Sweep"""
+        if file_path.endswith('.mat'):
+            return self.read_mat(file_path)
+        return self.read_csv(file_path)
+
+    def read_mat(self, file_path):
+        """Read the testResult struct of a Scylla .mat file; the metadata comes from the CSV next to it"""
+        if not MAT_SUPPORT:
+            raise ImportError("scipy is required to read .mat sweep files")
+        from scipy.io import loadmat
+
+        mat = loadmat(file_path, squeeze_me=True, struct_as_record=False)
+        if 'testResult' not in mat:
+            raise ValueError(f"No testResult struct in {file_path}")
+        test_result = mat['testResult']
+
+        rows = {'wavelength': np.ascontiguousarray(test_result.header.wavelength, dtype=np.float64)}
+        for name in test_result.rows._fieldnames:
+            rows[name] = np.ascontiguousarray(getattr(test_result.rows, name), dtype=np.float64)
+
+        n_points = rows['wavelength'].size
+        for tag, values in rows.items():
+            if values.size != n_points:
+                raise ValueError(f"Row {tag} has {values.size} points, expected {n_points} in {file_path}")
+
+        csv_path = os.path.splitext(file_path)[0] + '.csv'
+        header = self.read_header(csv_path) if os.path.exists(csv_path) else {}
+        return Sweep(file_path, header, rows)
+
+    def read_csv(self, file_path):
+        """Read a sweep CSV into a Sweep without going through pandas"""
+        header = {}
+        rows = {}
+        with open(file_path, 'r') as file:
+            for line in file:
+                if line.startswith('#'):
+                    self.read_header_line(line, header)
+                elif line.strip():
+                    tag, values = self.read_row(line)
+                    rows[tag] = values
+
+        if 'wavelength' not in rows:
+            raise ValueError(f"No wavelength row in {file_path}")
+
+        n_points = rows['wavelength'].size
+        for tag, values in rows.items():
+            if values.size != n_points:
+                raise ValueError(f"Row {tag} has {values.size} points, expected {n_points} in {file_path}")
+
+        return Sweep(file_path, header, rows)
@@ -0,0 +1,162 @@
+import numpy as np
+
+from .FigureRenderer import minmax_indices
+
+# Width (nm) of the bins residual statistics are kept in for evaluating the loss at any wavelength
+RESIDUAL_BIN_WIDTH = 0.1
+
+
+def polyfit_batch(wavelength, values, degree=4):
+    """Fit every row of values against the shared wavelength grid in one least-squares solve"""
+    vander = np.vander(wavelength, degree + 1)
+
+    # Scale the columns as np.polyfit does to keep the Vandermonde matrix well conditioned
+    scale = np.sqrt((vander * vander).sum(axis=0))
+    rcond = len(wavelength) * np.finfo(wavelength.dtype).eps
+    poly_coeffs, _, _, _ = np.linalg.lstsq(vander / scale, values.T, rcond=rcond)
+    poly_coeffs = poly_coeffs.T / scale
+
+    # Evaluate all fits with the same matrix, one row per sweep
+    poly_fits = poly_coeffs @ vander.T
+    return poly_coeffs, poly_fits
+
+
+def polyfit_weighted_batch(wavelength, values, weights, degree=4):
+    """Weighted fit of every row of values, solving all the normal equations as one batched system
+
+    weights is (n_sweeps, n_points), i.e. 0 for points QC rejected and 1 elsewhere. The fit is done in the
+    wavelength mapped onto [-1, 1], where the normal equations are well conditioned, and the coefficients
+    are converted back to powers of the wavelength for np.polyval.
+    """
+    center = (wavelength[0] + wavelength[-1]) / 2
+    half_span = (wavelength[-1] - wavelength[0]) / 2
+    vander = np.vander((wavelength - center) / half_span, degree + 1)
+
+    # (n_sweeps, degree + 1, degree + 1) normal matrices and right-hand sides, solved together
+    weights = np.asarray(weights, dtype=np.float64)
+    lhs = (vander.T[np.newaxis] * weights[:, np.newaxis, :]) @ vander
+    rhs = (weights * values) @ vander
+    scaled_coeffs = np.linalg.solve(lhs, rhs[..., np.newaxis])[..., 0]
+    poly_fits = scaled_coeffs @ vander.T
+
+    # Row k of transform holds the coefficients of ((x - center) / half_span) ** (degree - k) in powers of x
+    transform = np.zeros((degree + 1, degree + 1))
+    term = np.array([1.0])
+    for power in range(degree + 1):
+        transform[degree - power, degree - power:] = term
+        term = np.convolve(term, [1 / half_span, -center / half_span])
+    return scaled_coeffs @ transform, poly_fits
+
+
+class SweepResult:
+    """Insertion loss trace and polynomial fit of one calibration sweep"""
+
+    def __init__(self, bond, wavelength, power, insertion_loss, poly_coeff, poly_fit=None, source=None,
+                 valid=None):
+        self.bond = bond
+        self.source = source  # Sweep file the result was computed from
+        self.valid = valid  # Points used in the fit and its residuals, None for all of them
+        self.wavelength = wavelength
+        self.power = power  # Raw channel power (dBm)
+        self.insertion_loss = insertion_loss  # Reference minus channel power (dB)
+        self.poly_coeff = poly_coeff
+        self.poly_fit = np.polyval(poly_coeff, wavelength) if poly_fit is None else poly_fit
+
+        self.losses = {}  # (target wavelength, window) -> (loss, uncertainty)
+        self.residual_profiles = {}  # bin width -> (first bin, residual sum of squares per bin, points per bin)
+        self.released = False
+
+    @classmethod
+    def from_sweep(cls, bond, wavelength, power, reference, channel, degree=4, source=None, valid=None):
+        """Take the difference to the Reference channel on the sweep's grid and fit it, on the valid points only"""
+        ref_channel_interpolated = reference.interpolate(wavelength, channel)
+        insertion_loss = -(power - ref_channel_interpolated)
+        if valid is None or valid.all():
+            poly_coeff = np.polyfit(wavelength, insertion_loss, degree)
+            valid = None
+        else:
+            poly_coeff = np.polyfit(wavelength[valid], insertion_loss[valid], degree)
+        return cls(bond, wavelength, power, insertion_loss, poly_coeff, source=source, valid=valid)
+
+    @classmethod
+    def from_batch(cls, bonds, wavelength, powers, reference, channel, degree=4, sources=None, valid=None):
+        """Fit a (n_sweeps, n_points) stack of sweeps that share one wavelength grid
+
+        valid is an optional (n_sweeps, n_points) mask of the points to fit, i.e. from SweepQC.
+        """
+        ref_channel_interpolated = reference.interpolate(wavelength, channel)
+        insertion_losses = -(powers - ref_channel_interpolated)
+        if valid is None or valid.all():
+            poly_coeffs, poly_fits = polyfit_batch(wavelength, insertion_losses, degree)
+            valid = [None] * len(bonds)
+        else:
+            poly_coeffs, poly_fits = polyfit_weighted_batch(wavelength, insertion_losses, valid, degree)
+        if sources is None:
+            sources = [None] * len(bonds)
+        return [cls(bond, wavelength, power, insertion_loss, poly_coeff, poly_fit, source, sweep_valid)
+                for bond, power, insertion_loss, poly_coeff, poly_fit, source, sweep_valid
+                in zip(bonds, powers, insertion_losses, poly_coeffs, poly_fits, sources, valid)]
+
+    def release(self, max_points):
+        """Keep only the plotted min/max envelope of the traces to free the full-length arrays
+
+        The kept points are the union of the power, insertion loss and fit envelopes, up to about 3 * max_points
+        of each array, so a released result still holds O(max_points) memory.
+        Losses must be evaluated with loss_at before releasing, afterwards only those are available.
+        """
+        if max_points is None:
+            return
+        self.residual_profile()  # Keep what LossSpectrum needs before the residuals are dropped
+
+        indices = np.union1d(minmax_indices(self.power, max_points), minmax_indices(self.insertion_loss, max_points))
+        indices = np.union1d(indices, minmax_indices(self.poly_fit, max_points))
+
+        self.wavelength = self.wavelength[indices]
+        self.power = self.power[indices]
+        self.insertion_loss = self.insertion_loss[indices]
+        self.poly_fit = self.poly_fit[indices]
+        if self.valid is not None:
+            self.valid = self.valid[indices]
+        self.released = True
+
+    def residual_profile(self, bin_width=RESIDUAL_BIN_WIDTH):
+        """Residual sum of squares and point count of the fit in bins of bin_width nm, bin k covering
+        [k * bin_width, (k + 1) * bin_width); returns (first bin, sums of squares, counts)"""
+        if bin_width not in self.residual_profiles:
+            if self.released:
+                raise ValueError(f"Residuals in {bin_width} nm bins were not kept before the sweep was released")
+            bins = np.floor(self.wavelength / bin_width).astype(np.int64)
+            first_bin = int(bins.min())
+            residuals = self.insertion_loss - self.poly_fit
+            n_bins = bins.max() - first_bin + 1
+            weights = np.ones(len(bins)) if self.valid is None else self.valid.astype(np.float64)
+            self.residual_profiles[bin_width] = (
+                first_bin, np.bincount(bins - first_bin, weights=weights * residuals ** 2, minlength=n_bins),
+                np.bincount(bins - first_bin, weights=weights, minlength=n_bins).astype(np.int64))
+        return self.residual_profiles[bin_width]
+
+    def loss_at(self, target_wavelength, window=5):
+        """Fitted loss and its uncertainty at the target wavelength, or None if the sweep does not cover it"""
+        key = (target_wavelength, window)
+        if key not in self.losses:
+            if self.released:
+                raise ValueError(f"Loss at {target_wavelength} nm was not evaluated before the sweep was released")
+            self.losses[key] = self.evaluate_loss(target_wavelength, window)
+        return self.losses[key]
+
+    def evaluate_loss(self, target_wavelength, window):
+        """Evaluate the fit at the target wavelength, with the residual uncertainty within the window"""
+        wavl_range_mask = (self.wavelength >= (target_wavelength - window)) & (
+                self.wavelength <= (target_wavelength + window))
+        if self.valid is not None:
+            wavl_range_mask &= self.valid  # Points rejected by QC do not count towards the uncertainty
+        if not np.any(wavl_range_mask):
+            return None
+
+        loss = np.polyval(self.poly_coeff, target_wavelength)
+
+        # Uncertainty of the fit from the residuals around the target wavelength
+        residuals = self.insertion_loss[wavl_range_mask] - self.poly_fit[wavl_range_mask]
+        residual_sum_of_squares = np.sum(residuals ** 2)
+        total_variance = residual_sum_of_squares / (len(residuals) - len(self.poly_coeff))
+        return loss, np.sqrt(total_variance)
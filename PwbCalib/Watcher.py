@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from .LossTable import make_calib
+
+
+class Watcher:
+    """Re-analyze only new or changed bond folders while a chip is being measured"""
+
+    def __init__(self, base_path, ref_file_path, devices=None, results_directory=None, interval=60, cache_dir=None,
+                 qc=True):
+        self.base_path = base_path
+        self.interval = interval
+
+        if results_directory is None:
+            results_directory = os.path.join(os.path.dirname(base_path), 'analysis_results')
+        self.results_directory = results_directory
+        self.state_path = os.path.join(results_directory, 'watch_state.json')
+
+        # GraphCalib provides the folder conventions, the sweep reading and the QC and fit of each sweep; set up
+        # from config.yaml as for the report, so a 'cutback' section de-embeds the reference here too
+        self.calib, self.devices = make_calib(base_path, ref_file_path, devices, cache_dir=cache_dir, qc=qc)
+        self.ref_file_path = self.calib.ref_file_path  # i.e. the cut-back references instead of ref_file_path
+        self.reference = None
+        self.state = None
+
+    def signature(self, file_path):
+        """What identifies a version of a file: its size and modification time"""
+        stat = os.stat(file_path)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def load_state(self):
+        """State of the previous runs, started over if the references or devices have changed"""
+        reference = [{'path': file_path, **self.signature(file_path)} for file_path in self.calib.reference_files()]
+
+        state = None
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as file:
+                state = json.load(file)
+
+        qc = self.calib.qc is not None
+        if (state is None or state['reference'] != reference or state['devices'] != self.devices
+                or state.get('qc') != qc or state.get('ref_lengths') != self.calib.ref_lengths):
+            state = {'reference': reference, 'ref_lengths': self.calib.ref_lengths, 'devices': self.devices, 'qc': qc,
+                     'sweeps': {}}
+            self.reference = None
+
+        if self.reference is None:
+            if not self.calib.load_reference():
+                raise ValueError(f"Error reading reference data {self.ref_file_path}")
+            self.reference = self.calib.reference
+        return state
+
+    def save_state(self):
+        """Write the state file atomically so an interrupted run never leaves it half written"""
+        os.makedirs(self.results_directory, exist_ok=True)
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.state, file, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def find_sweep_files(self):
+        """Sweep file of every calibration bond folder, keyed by path, with its bond number"""
+        sweep_files = {}
+        for folder_name in sorted(os.listdir(self.base_path)):
+            folder_path = os.path.join(self.base_path, folder_name)
+            if os.path.isdir(folder_path) and 'calibration_ST2ST' in folder_name:
+                differentiating_number = self.calib.extract_number_from_folder(folder_name)
+                for csv_file in self.calib.get_csv_files(folder_path):
+                    file_path = self.calib.sweep_file(os.path.join(folder_path, csv_file))
+                    sweep_files[file_path] = differentiating_number
+        return sweep_files
+
+    def analyze_sweep(self, file_path, differentiating_number):
+        """Loss and uncertainty of one sweep for every device, or None if it cannot be read
+
+        The sweep is screened and fitted as in the report: floor points get no weight, and a channel whose
+        Fine Align did not pass or that is mostly at the floor gives no losses. The outlier check needs the
+        whole batch, so it is left to the report.
+        """
+        data = self.calib.read_csv(file_path)
+        if data is None:
+            return None
+
+        losses = []
+        results_by_channel = {}
+        for device in self.devices:
+            channel = device['channel']
+            if channel not in results_by_channel:
+                qc_rows = []
+                results_by_channel[channel] = self.calib.fit_sweep(channel, differentiating_number, data, qc_rows, [])
+                for row in qc_rows:
+                    print(f"Excluded bond {row['Bond']} {channel}: {row['Excluded']}")
+            if results_by_channel[channel] is None:
+                continue
+            loss_at_wavl = results_by_channel[channel].loss_at(device['wavelength'])
+            if loss_at_wavl is not None:
+                losses.append([device['wavelength'], channel, float(loss_at_wavl[0]), float(loss_at_wavl[1])])
+        return losses
+
+    def loss_dataframe(self):
+        """Per-bond loss of every sweep in the state"""
+        loss_data = []
+        for sweep in self.state['sweeps'].values():
+            for wavelength, channel, loss, uncertainty in sweep['losses']:
+                loss_data.append({
+                    'Wavelength (nm)': wavelength,
+                    'Channel': channel,
+                    'Bond': int(sweep['bond']),
+                    'Loss (dB)': loss,
+                    'Uncertainty (dB)': uncertainty
+                })
+        loss_df = pd.DataFrame(loss_data, columns=['Wavelength (nm)', 'Channel', 'Bond', 'Loss (dB)',
+                                                   'Uncertainty (dB)'])
+        return loss_df.sort_values(['Wavelength (nm)', 'Channel', 'Bond'], ignore_index=True)
+
+    def summary_dataframe(self, loss_df):
+        """Mean, standard deviation and standard error of the mean of the bond losses per device"""
+        summary = []
+        for (wavelength, channel), device_df in loss_df.groupby(['Wavelength (nm)', 'Channel'], sort=True):
+            differences = device_df['Loss (dB)'].to_numpy()
+            average_difference = np.mean(differences)
+            std_deviation = np.std(differences)
+            sem = std_deviation / np.sqrt(len(differences))  # Standard error of the mean
+            summary.append({
+                'Wavelength (nm)': wavelength,
+                'Channel': channel,
+                'Bonds': len(differences),
+                'Average (dB)': average_difference,
+                'Std Dev (dB)': std_deviation,
+                'SEM (dB)': sem,
+                'Total Uncertainty (dB)': np.sqrt(std_deviation ** 2 + sem ** 2)
+            })
+        return pd.DataFrame(summary)
+
+    def run_once(self):
+        """Analyze new or changed sweeps, then rewrite the loss CSV and summary; returns the updated paths"""
+        self.state = self.load_state()
+        sweeps = self.state['sweeps']
+
+        sweep_files = self.find_sweep_files()
+        updated = []
+        for file_path, differentiating_number in sweep_files.items():
+            signature = self.signature(file_path)
+            previous = sweeps.get(file_path)
+            if previous is not None and previous['signature'] == signature:
+                continue
+
+            losses = self.analyze_sweep(file_path, differentiating_number)
+            if losses is not None:
+                sweeps[file_path] = {'signature': signature, 'bond': differentiating_number, 'losses': losses}
+                updated.append(file_path)
+
+        # Forget sweeps whose folder was removed or renamed, i.e. to EXCLUDED...
+        for file_path in [f for f in sweeps if f not in sweep_files]:
+            del sweeps[file_path]
+            updated.append(file_path)
+
+        self.save_state()
+
+        loss_df = self.loss_dataframe()
+        summary_df = self.summary_dataframe(loss_df)
+        # Kept apart from the report's loss_data.csv, which also has the batch outlier check
+        loss_df.to_csv(os.path.join(self.results_directory, 'watch_loss_data.csv'), index=False)
+        summary_df.to_csv(os.path.join(self.results_directory, 'watch_loss_summary.csv'), index=False)
+
+        if updated:
+            print(f"Updated {len(updated)} sweeps, {len(sweeps)} in total")
+            for _, row in summary_df.iterrows():
+                print(f"Average difference at {row['Wavelength (nm)']} nm ({row['Channel']}, {row['Bonds']} bonds): "
+                      f"{row['Average (dB)']:.2f} +/- {row['Total Uncertainty (dB)']:.2f} dB")
+        return updated
+
+    def watch(self):
+        """Poll the measurement folder every interval seconds until interrupted"""
+        print(f"Watching {self.base_path} every {self.interval} s, press Ctrl+C to stop")
+        try:
+            while True:
+                self.run_once()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("Stopped watching")
@@ -3,7 +3,12 @@
 __author__ = """Tenna Yuan"""
 __email__ = 'tenna@student.ubc.ca'
 __version__ = '0.1.0'
-__all__ = ['GraphCalib', 'Execute']
+__all__ = ['GraphCalib', 'Execute', 'BatchRunner', 'LossTable', 'CalibService', 'ResultsStore', 'LossSpectrum']
 
-from PwbCalib import GraphCalib
-from PwbCalib import Execute
\ No newline at end of file
+
+def __getattr__(name):
+    """Import the submodules on first use, so 'import PwbCalib' does not load pandas, matplotlib or reportlab"""
+    if name in __all__:
+        import importlib
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
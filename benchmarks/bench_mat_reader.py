@@ -0,0 +1,56 @@
+"""Compare reading the 01_Becky sweeps from the .mat files against parsing the CSV text.
+
+Run from the repository root:
+    python benchmarks/bench_mat_reader.py [data_dir] [--repeat N]
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PwbCalib.SweepReader import SweepReader, MAT_SUPPORT
+from bench_sweep_reader import find_sweep_files, time_reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('data_dir', nargs='?', default=os.path.join(os.getcwd(), '01_Becky'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if not MAT_SUPPORT:
+        print("scipy is not installed, the .mat backend is unavailable")
+        return
+
+    csv_files = [f for f in find_sweep_files(args.data_dir) if os.path.exists(f[:-len('.csv')] + '.mat')]
+    mat_files = [f[:-len('.csv')] + '.mat' for f in csv_files]
+    if not csv_files:
+        print(f"No CSV/.mat sweep pairs found in {args.data_dir}")
+        return
+
+    # The .mat rows hold the full precision values the CSV rounds to 4 decimals
+    reader = SweepReader()
+    max_difference = 0.0
+    for csv_file, mat_file in zip(csv_files, mat_files):
+        csv_sweep = reader.read_csv(csv_file)
+        mat_sweep = reader.read_mat(mat_file)
+        assert list(csv_sweep.rows) == list(mat_sweep.rows)
+        for name in csv_sweep.rows:
+            max_difference = max(max_difference, np.max(np.abs(csv_sweep[name] - mat_sweep[name])))
+
+    csv_time = time_reader(reader.read_csv, csv_files, args.repeat)
+    mat_time = time_reader(reader.read_mat, mat_files, args.repeat)
+    csv_mb = sum(os.path.getsize(f) for f in csv_files) / 1e6
+    mat_mb = sum(os.path.getsize(f) for f in mat_files) / 1e6
+
+    print(f"{len(csv_files)} sweeps, CSV {csv_mb:.1f} MB, .mat {mat_mb:.1f} MB")
+    print(f"Largest CSV/.mat difference: {max_difference:.2g}")
+    print(f"CSV (SweepReader.read_csv): {csv_time:.3f} s")
+    print(f".mat (SweepReader.read_mat): {mat_time:.3f} s")
+    print(f"Speedup:                    {csv_time / mat_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Time the parse, fit, render and report stages of Execute on synthetic measurement folders.
+
+Every run appends a record to a JSON lines results file, so timings can be compared across versions.
+Run from the repository root:
+    python benchmarks/bench_pipeline.py [--bonds 8 32] [--points N] [--channels N] [--repeat N] [--compare]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PwbCalib.Execute import Execute
+from synthetic_sweeps import make_measurement
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Profiler stages reported by the benchmark, in pipeline order
+STAGES = ['read', 'reference', 'fit', 'plot', 'loss', 'render', 'pdf_report']
+
+
+def git_revision():
+    """Short commit hash of the working tree, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(base_path, ref_file_path, results_directory, figure_workers, streaming):
+    """Generate the full report once with a cold figure cache and return the profiler report"""
+    shutil.rmtree(results_directory, ignore_errors=True)
+    executor = Execute(base_path, ref_file_path, 'Synthetic', '2024-07-03', 'PWB',
+                       results_directory=results_directory, figure_workers=figure_workers, streaming=streaming,
+                       profile=True)
+    executor.genReport()
+    return executor.profiler.report()
+
+
+def benchmark(n_bonds, n_points, n_channels, repeat, figure_workers, streaming):
+    """Best-of-repeat seconds per stage for one dataset size"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        base_path = os.path.join(tmp_dir, 'Synthetic', '1550_TE')
+        ref_file_path, _ = make_measurement(base_path, n_bonds, n_points, n_channels)
+        results_directory = os.path.join(tmp_dir, 'Synthetic', 'analysis_results')
+
+        reports = []
+        for _ in range(repeat):
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull  # Keep the per-bond printout out of the results
+                try:
+                    reports.append(run_once(base_path, ref_file_path, results_directory, figure_workers,
+                                            streaming))
+                finally:
+                    sys.stdout = stdout
+
+    stages = {stage: min(report['stages'].get(stage, {}).get('seconds', 0.0) for report in reports)
+              for stage in STAGES}
+    return {
+        'config': {'bonds': n_bonds, 'points': n_points, 'channels': n_channels, 'streaming': streaming,
+                   'figure_workers': figure_workers},
+        'total_seconds': min(report['total_seconds'] for report in reports),
+        'stages': stages,
+        'counters': reports[0]['counters']
+    }
+
+
+def load_results(results_path):
+    """Previous records of the results file, oldest first"""
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(record, previous, threshold):
+    """Print the stage ratios against the previous record of the same config; True if any regressed"""
+    regressed = False
+    for stage in STAGES + ['total_seconds']:
+        if stage == 'total_seconds':
+            now, before = record['total_seconds'], previous['total_seconds']
+        else:
+            now, before = record['stages'][stage], previous['stages'].get(stage, 0.0)
+        if before <= 0:
+            continue
+        ratio = now / before
+        flag = ''
+        # Stages under 10 ms are too noisy to call a regression
+        if ratio > threshold and now - before > 0.01:
+            flag = '  <-- slower'
+            regressed = True
+        print(f"  {stage:<14} {before:8.3f} s -> {now:8.3f} s  ({ratio:.2f}x){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bonds', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--points', type=int, default=31500)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--figure-workers', type=int, default=None)
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--label', default=None, help='name of this run in the results file, i.e. a branch name')
+    parser.add_argument('--results', default=os.path.join(BENCHMARK_DIR, 'results', 'bench_pipeline.jsonl'),
+                        help='JSON lines file the records are appended to')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare with the last record of the same config and exit 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio --compare fails at')
+    args = parser.parse_args()
+
+    history = load_results(args.results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+
+    regressed = False
+    for n_bonds in args.bonds:
+        record = benchmark(n_bonds, args.points, args.channels, args.repeat, args.figure_workers, args.streaming)
+        record.update({
+            'label': args.label,
+            'revision': git_revision(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count()
+        })
+
+        print(f"{n_bonds} bonds, {args.points} points, {args.channels} channels: "
+              f"{record['total_seconds']:.3f} s total")
+        for stage in STAGES:
+            print(f"  {stage:<14} {record['stages'][stage]:8.3f} s")
+
+        if args.compare:
+            previous = [r for r in history if r['config'] == record['config']]
+            if previous:
+                print(f"Compared with {previous[-1]['revision']} ({previous[-1]['date']}):")
+                regressed |= compare(record, previous[-1], args.threshold)
+            else:
+                print("No previous record of this config to compare with")
+
+        with open(args.results, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+    print(f"Results appended to {args.results}")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
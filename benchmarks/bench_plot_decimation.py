@@ -0,0 +1,67 @@
+"""Time rendering the full-spectrum figures with and without min/max decimation.
+
+Run from the repository root:
+    python benchmarks/bench_plot_decimation.py [measurement_dir] [--channel channel_1] [--points 4000]
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matplotlib.image import imread
+from PwbCalib.GraphCalib import GraphCalib
+from PwbCalib.FigureRenderer import render_figure
+
+
+def record_figures(base_path, ref_file_path, channel, max_plot_points):
+    """The calibRaw, calibLoss and fittedLoss specs GraphCalib would queue for rendering"""
+    calib = GraphCalib(base_path, ref_file_path, channel, 0, max_plot_points=max_plot_points)
+    calib.load_data()
+    ref_wavelength = calib.reference.wavelength
+    ref_channel = calib.reference[channel]
+    results = calib.compute_results(calib.data_dict, calib.reference)
+
+    calib.plot_raw_calibration_data(results, ref_wavelength, ref_channel)
+    calib.plot_difference_data(results)
+    calib.fitted_loss(results)
+    return calib.pending_figures
+
+
+def render_all(figures):
+    """Wall time to render every figure in this process, and the PNGs"""
+    start = time.perf_counter()
+    images = [render_figure(figure) for figure in figures]
+    return time.perf_counter() - start, images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base_path', nargs='?', default=os.path.join(os.getcwd(), '01_Becky', '1550_TE'))
+    parser.add_argument('--ref', default=os.path.join('ref_long_2_1', '03-Jul-2024 18.07.47.csv'),
+                        help='reference CSV relative to base_path')
+    parser.add_argument('--channel', default='channel_1')
+    parser.add_argument('--points', type=int, default=4000, help='max_plot_points of the decimated run')
+    args = parser.parse_args()
+
+    ref_file_path = os.path.join(args.base_path, args.ref)
+    full_time, full_images = render_all(record_figures(args.base_path, ref_file_path, args.channel, None))
+    thin_time, thin_images = render_all(record_figures(args.base_path, ref_file_path, args.channel, args.points))
+
+    print(f"Full traces:         {full_time:.3f} s, {sum(len(i) for i in full_images) / 1e3:.0f} kB of PNG")
+    print(f"{args.points} points/trace: {thin_time:.3f} s, {sum(len(i) for i in thin_images) / 1e3:.0f} kB of PNG")
+    print(f"Speedup:             {full_time / thin_time:.1f}x")
+
+    # Visual difference at report resolution
+    for full_image, thin_image in zip(full_images, thin_images):
+        full_pixels = imread(io.BytesIO(full_image))
+        thin_pixels = imread(io.BytesIO(thin_image))
+        changed = np.any(np.abs(full_pixels - thin_pixels) > 0.1, axis=-1)
+        print(f"Pixels changed by more than 10%: {100 * changed.mean():.3f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Compare the pandas read-then-transpose path against SweepReader on the 01_Becky sweeps.
+
+Run from the repository root:
+    python benchmarks/bench_sweep_reader.py [data_dir] [--repeat N]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PwbCalib.SweepReader import SweepReader
+
+
+def read_pandas(file_path):
+    """The original GraphCalib.read_csv path, plus the astype(float) every plot then applied"""
+    data = pd.read_csv(file_path, comment='#', header=None)
+    data = data.transpose()
+    data.columns = data.iloc[0]
+    data = data.drop(data.index[0])
+    return {name: data[name].astype(float).to_numpy() for name in data.columns}
+
+
+def find_sweep_files(data_dir):
+    """All sweep CSVs below data_dir, excluding generated results"""
+    files = []
+    for root, _, names in os.walk(data_dir):
+        if 'analysis_results' in root:
+            continue
+        files.extend(os.path.join(root, name) for name in names if name.endswith('.csv'))
+    return sorted(files)
+
+
+def time_reader(read, files, repeat):
+    """Best-of-repeat wall time to read every file"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file_path in files:
+            read(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('data_dir', nargs='?', default=os.path.join(os.getcwd(), '01_Becky'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    files = find_sweep_files(args.data_dir)
+    if not files:
+        print(f"No sweep files found in {args.data_dir}")
+        return
+
+    # Both paths must agree before the timings mean anything
+    reader = SweepReader()
+    for file_path in files:
+        expected = read_pandas(file_path)
+        sweep = reader.read(file_path)
+        for name, values in expected.items():
+            np.testing.assert_array_equal(sweep[name], values)
+
+    pandas_time = time_reader(read_pandas, files, args.repeat)
+    reader_time = time_reader(reader.read, files, args.repeat)
+    size_mb = sum(os.path.getsize(f) for f in files) / 1e6
+
+    print(f"{len(files)} files, {size_mb:.1f} MB")
+    print(f"pandas read + transpose: {pandas_time:.3f} s ({size_mb / pandas_time:.1f} MB/s)")
+    print(f"SweepReader:             {reader_time:.3f} s ({size_mb / reader_time:.1f} MB/s)")
+    print(f"Speedup:                 {pandas_time / reader_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Generate Scylla format measurement folders of any size for the benchmarks.
+
+Run from the repository root to write a dataset to disk:
+    python benchmarks/synthetic_sweeps.py OUTPUT_DIR [--bonds N] [--points N] [--channels N]
+"""
+import os
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import yaml
+
+START_WAVELENGTH = 1457.0  # nm, as in the 01_Becky sweeps
+STEP = 0.004  # nm
+LASER_POWER = -2.7126  # dBm
+
+
+def sweep_grid(n_points):
+    """Wavelength grid of a sweep with n_points, i.e. 1457.004 to 1583 nm for 31500 points"""
+    return np.round(START_WAVELENGTH + STEP * np.arange(1, n_points + 1), 4)
+
+
+def coupler_transmission(wavelength, rng):
+    """Grating coupler pair transmission (dBm): a parabola in dB centred in the sweep plus ripple"""
+    center = wavelength[len(wavelength) // 2]
+    span = max(wavelength[-1] - wavelength[0], 1.0)
+    curvature = 40 / span ** 2
+    ripple = 0.2 * np.sin(2 * np.pi * (wavelength - wavelength[0]) / 3.1 + rng.uniform(0, 2 * np.pi))
+    return LASER_POWER - 15 - curvature * (wavelength - center) ** 2 + ripple
+
+
+def measured(power, rng, noise_floor=-75.0):
+    """Add detector noise and clip to the noise floor, rounded to the 4 decimals Scylla writes"""
+    power = power + rng.normal(0, 0.02, power.shape)
+    return np.round(np.maximum(power, noise_floor + rng.normal(0, 2, power.shape)), 4)
+
+
+def write_sweep(file_path, device_id, start, wavelength, channels):
+    """Write one sweep CSV with the Scylla '#' header and one 'tag,v1,v2,...' row per channel"""
+    finish = start + timedelta(seconds=83)
+    lines = [
+        '# Test:\tLaser Sweep (sweepLaser)',
+        '# User:\tBenchmark',
+        f'# Start:\t{start:%d-%b-%Y %H:%M:%S}',
+        f'# Finish:\t{finish:%d-%b-%Y %H:%M:%S}',
+        '# Fine Align:\t Passed',
+        f'# Device ID:\t {device_id}',
+        '# Settings:',
+        '#\tLaser:\tHP81680A',
+        '#\tDetector:\tHP81635A',
+        '#\tSweep speed:\t40 nm/s',
+        f'#\tLaser power:\t{LASER_POWER} dBm',
+        f'#\tWavelength step-size:\t{STEP} nm',
+        f'#\tStart wavelength:\t{START_WAVELENGTH:g} nm',
+        f'#\tStop wavelength:\t{wavelength[-1]:g} nm',
+        '#Metric Tag, value [, value]',
+        'wavelength,' + ','.join(f'{value:g}' for value in wavelength),
+    ]
+    for name, values in channels.items():
+        lines.append(f'{name},' + ','.join(np.char.mod('%.4f', values)))
+
+    with open(file_path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def make_measurement(base_path, n_bonds=8, n_points=31500, n_channels=4, sweeps_per_bond=1, seed=0):
+    """Write a measurement folder like 01_Becky/1550_TE: bond folders, references and config.yaml
+
+    Channel 1 carries the signal, the others sit at the noise floor as in the real data.
+    Returns the reference CSV path and the devices of the config.yaml.
+    """
+    rng = np.random.default_rng(seed)
+    wavelength = sweep_grid(n_points)
+    coupler = coupler_transmission(wavelength, rng)
+    start = datetime(2024, 7, 3, 18, 0, 0)
+
+    def channels(signal):
+        rows = {'channel_1': measured(signal, rng)}
+        for i in range(2, n_channels + 1):
+            rows[f'channel_{i}'] = measured(np.full(n_points, -90.0), rng)
+        return rows
+
+    def write_folder(folder_name, signal):
+        nonlocal start
+        folder_path = os.path.join(base_path, folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+        file_path = os.path.join(folder_path, f'{start:%d-%b-%Y %H.%M.%S}.csv')
+        write_sweep(file_path, folder_name, start, wavelength, channels(signal))
+        start += timedelta(seconds=90)
+        return file_path
+
+    # References of two lengths with 0.8 dB/mm of propagation loss
+    lengths = {'ref_short_2_1': 0.5, 'ref_long_2_1': 2.0}
+    ref_file_paths = {name: write_folder(name, coupler - 0.8 * length) for name, length in lengths.items()}
+
+    # Bonds lose 0.3 to 1.6 dB more than the long reference they are measured against
+    for bond in range(1, n_bonds + 1):
+        bond_loss = rng.uniform(0.3, 1.6)
+        slope = rng.normal(0, 0.005)
+        for sweep in range(1, sweeps_per_bond + 1):
+            signal = coupler - 0.8 * lengths['ref_long_2_1'] - bond_loss - slope * (wavelength - wavelength[0])
+            write_folder(f'calibration_ST2ST_1Bond_{bond}_{sweep}', signal)
+
+    center = int(np.round(wavelength[len(wavelength) // 2]))
+    devices = [{'wavelength': center, 'channel': 'channel_1'}]
+    config = {'reference': 'ref_long_2_1', 'devices': devices}
+    with open(os.path.join(base_path, 'config.yaml'), 'w') as file:
+        yaml.safe_dump(config, file, sort_keys=False)
+
+    return ref_file_paths['ref_long_2_1'], devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir', help='measurement folder to create, i.e. synthetic/1550_TE')
+    parser.add_argument('--bonds', type=int, default=8)
+    parser.add_argument('--points', type=int, default=31500)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--sweeps-per-bond', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    make_measurement(args.output_dir, args.bonds, args.points, args.channels, args.sweeps_per_bond, args.seed)
+    print(f"Wrote {args.bonds} bonds of {args.points} points and {args.channels} channels to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,119 @@
 import os
-from PwbCalib.Execute import Execute
+import sys
+import argparse
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate PWB calibration reports.')
+    parser.add_argument('--batch', metavar='ROOT',
+                        help='analyze every measurement folder below ROOT, i.e. 01_Becky, in parallel')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes for --batch, or for the --serve report builds')
+    parser.add_argument('--serve', metavar='ROOT',
+                        help='serve loss queries and reports for every measurement folder below ROOT over HTTP')
+    parser.add_argument('--host', default='127.0.0.1', help='address --serve listens on')
+    parser.add_argument('--port', type=int, default=8765, help='port --serve listens on')
+    parser.add_argument('--process', default='PWB')
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help='cache parsed sweeps in DIR so repeat runs skip parsing the CSV files')
+    parser.add_argument('--streaming', action='store_true',
+                        help='fit each sweep as it is read and keep only its plotted envelope, about 6x less memory')
+    parser.add_argument('--profile', action='store_true',
+                        help='write a JSON timing report, profile.json, with stage timers and counters')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='also dump cProfile statistics to profile.prof next to the timing report')
+    parser.add_argument('--numbers', action='store_true',
+                        help='only compute loss_data.csv: no figures or PDF, and only NumPy is imported')
+    parser.add_argument('--no-qc', dest='qc', action='store_false',
+                        help='fit every point of every sweep: no noise floor, Fine Align or outlier checks')
+    parser.add_argument('--store', metavar='DB', default=None,
+                        help='append every run\'s bond losses to the SQLite results store DB')
+    parser.add_argument('--trend', nargs=2, metavar=('WAVELENGTH', 'CHANNEL'),
+                        help='print the mean loss per stored run for a device from --store DB and exit')
+    parser.add_argument('--spectrum', metavar='MODEL',
+                        help='evaluate a saved loss_model_<channel>.npz every --step nm and write MODEL_spectrum.npz')
+    parser.add_argument('--step', type=float, default=1.0, help='wavelength step (nm) for --spectrum')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep re-analyzing new or changed bond folders while the chip is measured')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between checks for --watch')
+    args = parser.parse_args()
 
-    base_path = os.path.join(os.getcwd(), '01_Becky', '1550_TE')
-    ref_file_path = os.path.join(os.getcwd(), '01_Becky', '1550_TE','ref_long_2_1','03-Jul-2024 18.07.47.csv')
+    if args.spectrum:
+        import numpy as np
+        from PwbCalib.LossSpectrum import LossSpectrum
 
-    chip_name = ' 20240626_Chip5_Becky'
-    measure_date = '2024-07-03'  # YYYY-MM-DD
-    process = 'PWB'
+        spectrum = LossSpectrum.load(args.spectrum)
+        start, stop = spectrum.wavelength_range
+        wavelengths = np.arange(np.ceil(start / args.step) * args.step, stop, args.step)
+        spectrum_path = os.path.splitext(args.spectrum)[0] + '_spectrum.npz'
+        spectrum.export(spectrum_path, wavelengths)
+        print(f"Loss of {len(spectrum.bonds)} sweeps at {len(wavelengths)} wavelengths saved to {spectrum_path}")
+    elif args.trend:
+        from PwbCalib.ResultsStore import ResultsStore
 
-    executor = Execute(base_path, ref_file_path, chip_name, measure_date, process)
-    executor.genReport()
\ No newline at end of file
+        wavelength, channel = float(args.trend[0]), args.trend[1]
+        for row in ResultsStore(args.store or 'results.db').trend(wavelength, channel):
+            print(f"{row['measure_date']} {row['chip']}/{row['measurement']} run {row['run_id']}: "
+                  f"{row['mean_loss']:.2f} +/- {row['std_loss']:.2f} dB over {row['bonds']} bonds")
+    elif args.serve:
+        from PwbCalib.CalibService import CalibService
+
+        CalibService(args.serve, host=args.host, port=args.port, process=args.process, workers=args.workers,
+                     cache_dir=args.cache, qc=args.qc).run()
+    elif args.batch:
+        from PwbCalib.BatchRunner import BatchRunner
+
+        BatchRunner(args.batch, process=args.process, workers=args.workers, cache_dir=args.cache,
+                    streaming=args.streaming, profile=args.profile, cprofile=args.cprofile,
+                    numbers_only=args.numbers, results_store=args.store, qc=args.qc).run()
+    else:
+        base_path = os.path.join(os.getcwd(), '01_Becky', '1550_TE')
+        ref_file_path = os.path.join(os.getcwd(), '01_Becky', '1550_TE','ref_long_2_1','03-Jul-2024 18.07.47.csv')
+
+        chip_name = ' 20240626_Chip5_Becky'
+        measure_date = '2024-07-03'  # YYYY-MM-DD
+        process = args.process
+
+        if args.numbers:
+            from PwbCalib.LossTable import compute_losses, write_csv
+            from PwbCalib.Profiler import Profiler
+
+            results_directory = os.path.join(os.getcwd(), '01_Becky', 'analysis_results')
+            loss_csv_path = os.path.join(results_directory, 'loss_data.csv')
+            profiler = Profiler.for_results(results_directory, args.profile, args.cprofile)
+            profiler.start()
+            try:
+                rows = compute_losses(base_path, ref_file_path, cache_dir=args.cache, streaming=args.streaming,
+                                      profiler=profiler, qc=args.qc)
+            finally:
+                profiler.stop()
+            if rows is None:
+                print(f"Error reading reference data {ref_file_path}")
+                sys.exit(1)
+            write_csv(rows, loss_csv_path)
+            print(f"Loss data saved to {loss_csv_path}")
+            if profiler.enabled:
+                profile_path = os.path.join(results_directory, 'profile.json')
+                profiler.write(profile_path)
+                print(f"Timing report saved to {profile_path}")
+            if args.store:
+                from PwbCalib.Config import read_config, get_cutback
+                from PwbCalib.ResultsStore import ResultsStore
+
+                # Record the cut-back references when a 'cutback' section replaced the reference
+                cutback_file_paths, _ = get_cutback(base_path, read_config(base_path))
+                ResultsStore(args.store).append(rows, chip_name, os.path.basename(base_path), measure_date, process,
+                                                cutback_file_paths or ref_file_path)
+        elif args.watch:
+            from PwbCalib.BatchRunner import BatchRunner
+            from PwbCalib.Watcher import Watcher
+
+            # The config.yaml 'reference' as in --batch; the Watcher applies its devices and 'cutback' section
+            ref_file_path = BatchRunner(os.path.dirname(base_path)).find_reference_file(base_path)
+            Watcher(base_path, ref_file_path, interval=args.interval, cache_dir=args.cache, qc=args.qc).watch()
+        else:
+            from PwbCalib.Execute import Execute
+
+            executor = Execute(base_path, ref_file_path, chip_name, measure_date, process, cache_dir=args.cache,
+                               streaming=args.streaming, profile=args.profile, cprofile=args.cprofile,
+                               results_store=args.store, qc=args.qc)
+            executor.genReport()
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from synthetic_sweeps import make_measurement
+
+
+@pytest.fixture
+def measurement(tmp_path):
+    """Small synthetic measurement folder: (base_path, reference CSV, devices) with 6 bonds of 2000 points"""
+    base_path = str(tmp_path / '1550_TE')
+    ref_file_path, devices = make_measurement(base_path, n_bonds=6, n_points=2000, n_channels=2)
+    return base_path, ref_file_path, devices
@@ -0,0 +1,98 @@
+"""CalibService end to end on localhost, on a temporary copy of the 01_Becky measurements
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import asyncio
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from PwbCalib.CalibService import CalibService
+
+
+def request(method, url):
+    """Status and JSON payload of an HTTP request, also for error statuses"""
+    try:
+        with urlopen(Request(url, method=method), timeout=120) as response:
+            return response.status, json.load(response)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.fixture
+def root_path(tmp_path):
+    """Copy of 01_Becky without the PDFs, figures and earlier results"""
+    root_path = tmp_path / '01_Becky'
+    shutil.copytree(os.path.join(REPO_DIR, '01_Becky'), root_path,
+                    ignore=shutil.ignore_patterns('*.pdf', '*.png', 'analysis_results'))
+    return str(root_path)
+
+
+def test_calib_service(root_path):
+    asyncio.run(check_service(root_path))
+
+
+async def check_service(root_path):
+    service = CalibService(root_path, port=0, workers=1, warm=False)
+    await service.start()
+    loop = asyncio.get_running_loop()
+
+    async def call(method, path):
+        return await loop.run_in_executor(None, request, method, f'http://127.0.0.1:{service.port}{path}')
+
+    try:
+        status, payload = await call('GET', '/health')
+        assert status == 200 and payload['measurements'] == 2
+
+        # The report job builds the figures and PDF in the worker pool
+        status, job = await call('POST', '/report?chip=01_Becky&measurement=1550_TE')
+        assert status == 202
+        deadline = time.monotonic() + 300
+        while job['state'] in ('queued', 'running') and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            status, job = await call('GET', f"/jobs/{job['id']}")
+            assert status == 200
+        assert job['state'] == 'done', job['error']
+        assert os.path.exists(job['pdf_path'])
+
+        # The warm fits give the report's losses
+        with open(os.path.join(os.path.dirname(job['pdf_path']), 'loss_data.csv'), newline='') as file:
+            report_rows = list(csv.DictReader(file))
+        status, payload = await call('GET', '/loss?chip=01_Becky&measurement=1550_TE')
+        assert status == 200
+        assert [row['Bond'] for row in payload['rows']] == [int(row['Bond']) for row in report_rows]
+        assert [row['Loss (dB)'] for row in payload['rows']] == pytest.approx(
+            [float(row['Loss (dB)']) for row in report_rows], abs=1e-9)
+
+        status, payload = await call('GET', '/loss?chip=01_Becky&measurement=1550_TE&wavelength=1550&bond=3')
+        assert status == 200 and [row['Bond'] for row in payload['rows']] == [3]
+
+        # A channel missing from config.yaml is evaluated at the config.yaml wavelength
+        status, payload = await call('GET', '/loss?chip=01_Becky&measurement=1310_TE&channel=channel_2')
+        assert status == 200 and payload['rows']
+        assert {(row['Wavelength (nm)'], row['Channel']) for row in payload['rows']} == {(1310, 'channel_2')}
+
+        status, payload = await call('GET', '/qc?chip=01_Becky&measurement=1550_TE')
+        assert status == 200 and len(payload['rows']) == len(report_rows)
+        assert not any(row['Excluded'] for row in payload['rows'])
+
+        # Bad queries are 400s, unknown measurements, jobs and routes are 404s
+        for path in ('/loss', '/loss?chip=01_Becky&channel=channel_9', '/loss?chip=01_Becky&wavelength=abc'):
+            status, payload = await call('GET', path)
+            assert status == 400, path
+        for path in ('/loss?chip=02_Missing', '/qc?chip=01_Becky&measurement=1650_TE', '/jobs/99', '/nothing'):
+            status, payload = await call('GET', path)
+            assert status == 404, path
+    finally:
+        await service.stop()
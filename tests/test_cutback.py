@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pytest
+
+from PwbCalib.CutBack import CutBack, cutback_fit
+from PwbCalib.SweepReader import SweepReader
+
+
+def test_cutback_fit_recovers_known_line():
+    rng = np.random.default_rng(0)
+    intercept = rng.uniform(-20, -15, 300)
+    propagation_loss = rng.uniform(0.2, 1.5, 300)
+    lengths = np.array([0.5, 1.0, 2.0])
+    powers = intercept - propagation_loss * lengths[:, np.newaxis]
+
+    fitted_intercept, fitted_loss, residual = cutback_fit(lengths, powers)
+    np.testing.assert_allclose(fitted_intercept, intercept, atol=1e-10)
+    np.testing.assert_allclose(fitted_loss, propagation_loss, atol=1e-10)
+    np.testing.assert_allclose(residual, 0, atol=1e-10)
+
+    assert cutback_fit(lengths[:2], powers[:2])[2] is None  # No residual from two lengths
+
+
+def test_cutback_fit_needs_two_lengths():
+    with pytest.raises(ValueError):
+        cutback_fit([1.0, 1.0], np.zeros((2, 10)))
+
+
+def test_cutback_of_synthetic_references(measurement):
+    base_path, _, _ = measurement
+    reader = SweepReader()
+    sweeps = []
+    for name in ('ref_short_2_1', 'ref_long_2_1'):  # make_measurement writes them with 0.8 dB/mm
+        folder_path = os.path.join(base_path, name)
+        sweeps.append(reader.read(os.path.join(folder_path, os.listdir(folder_path)[0])))
+
+    cutback = CutBack(sweeps, [0.5, 2.0])
+    assert np.mean(cutback.propagation_loss['channel_1']) == pytest.approx(0.8, abs=0.01)
+    # The zero-length reference is the long one with its 1.6 dB of waveguide loss taken out
+    np.testing.assert_allclose(np.mean(cutback.reference()['channel_1'] - sweeps[1]['channel_1']), 1.6, atol=0.02)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from PwbCalib.LossSpectrum import LossSpectrum
+from PwbCalib.LossTable import make_calib
+
+
+@pytest.fixture
+def results(measurement):
+    base_path, ref_file_path, _ = measurement
+    calib, devices = make_calib(base_path, ref_file_path)
+    assert calib.prepare(devices)
+    return calib.channel_results('channel_1')
+
+
+def test_evaluate_matches_loss_at(results, tmp_path):
+    spectrum = LossSpectrum.from_results(results, 'channel_1')
+    start, stop = spectrum.wavelength_range
+    wavelengths = np.linspace(start + 1, stop - 1, 7)
+
+    loss, uncertainty = spectrum.evaluate(wavelengths)
+    sweeps = [result for bond in sorted(results, key=int) for result in results[bond]]
+    assert loss.shape == uncertainty.shape == (len(sweeps), len(wavelengths))
+    for i, result in enumerate(sweeps):
+        for j, wavelength in enumerate(wavelengths):
+            expected_loss, expected_uncertainty = result.loss_at(wavelength)
+            assert loss[i, j] == pytest.approx(expected_loss, abs=1e-9)
+            # The window edges are resolved to the 0.1 nm bins, a few of the 0.004 nm points apart
+            assert uncertainty[i, j] == pytest.approx(expected_uncertainty, rel=1e-2)
+
+    # A saved model evaluates the same
+    model_path = str(tmp_path / 'loss_model_channel_1.npz')
+    spectrum.save(model_path)
+    loaded = LossSpectrum.load(model_path)
+    assert loaded.channel == 'channel_1'
+    np.testing.assert_array_equal(loaded.evaluate(wavelengths)[0], loss)
+
+
+def test_evaluate_outside_the_sweeps_is_nan(results):
+    loss, uncertainty = LossSpectrum.from_results(results).evaluate([1000.0])
+    assert np.isnan(loss).all() and np.isnan(uncertainty).all()
+
+
+def test_no_results():
+    with pytest.raises(ValueError):
+        LossSpectrum.from_results({})
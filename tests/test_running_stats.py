@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from PwbCalib.RunningStats import RunningStats
+from PwbCalib.LossTable import compute_losses
+
+
+def test_running_stats_match_numpy():
+    rows = np.random.default_rng(0).normal(1.0, 0.3, (9, 500))
+    stats = RunningStats()
+    for row in rows:
+        stats.update(row)
+    assert stats.count == len(rows)
+    np.testing.assert_allclose(stats.mean, np.mean(rows, axis=0), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(stats.std, np.std(rows, axis=0), rtol=0, atol=1e-12)
+
+
+@pytest.mark.filterwarnings('ignore:Polyfit may be poorly conditioned')  # The synthetic sweeps span only 8 nm
+def test_streaming_losses_match_batch(measurement):
+    base_path, ref_file_path, _ = measurement
+    batch_rows = compute_losses(base_path, ref_file_path)
+    streamed_rows = compute_losses(base_path, ref_file_path, streaming=True)
+    assert [row['Bond'] for row in streamed_rows] == [row['Bond'] for row in batch_rows]
+    np.testing.assert_allclose([row['Loss (dB)'] for row in streamed_rows],
+                               [row['Loss (dB)'] for row in batch_rows], atol=1e-6)
+    np.testing.assert_allclose([row['Uncertainty (dB)'] for row in streamed_rows],
+                               [row['Uncertainty (dB)'] for row in batch_rows], atol=1e-6)
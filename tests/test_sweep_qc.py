@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from PwbCalib.SweepQC import SweepQC
+from PwbCalib.SweepResult import SweepResult
+from PwbCalib.LossTable import make_calib
+
+
+def curves(n_sweeps, outlier_depth, seed=0):
+    """SweepResults of flat losses with small random tilts, the last one bowed by outlier_depth dB"""
+    rng = np.random.default_rng(seed)
+    wavelength = np.linspace(1500.0, 1600.0, 1000)
+    x = (wavelength - 1550) / 50
+    results = []
+    for bond in range(1, n_sweeps + 1):
+        loss = rng.uniform(0.5, 2) + rng.normal(0, 0.05) * x
+        if bond == n_sweeps:
+            loss = loss + outlier_depth * x ** 2
+        results.append(SweepResult(bond, wavelength, -loss, loss, np.polyfit(wavelength, loss, 4)))
+    return results
+
+
+def test_valid_points_mask_floor_in_sweep_or_reference():
+    qc = SweepQC(noise_floor=-72.0)
+    powers = np.array([[-20.0, -75.0, -20.0, -20.0]])
+    reference = np.array([-15.0, -15.0, -80.0, -15.0])
+    np.testing.assert_array_equal(qc.valid_points(powers, reference), [[True, False, False, True]])
+    np.testing.assert_array_equal(qc.enough_points([[True, False, False, True], [True, False, False, False]]),
+                                  [True, False])
+
+
+def test_outlier_excluded_from_a_large_batch():
+    scores, excluded = SweepQC().outliers(curves(12, outlier_depth=6.0))
+    assert scores[-1] > 3.5
+    np.testing.assert_array_equal(np.flatnonzero(excluded), [11])
+
+
+def test_outlier_only_scored_in_a_small_batch():
+    scores, excluded = SweepQC().outliers(curves(8, outlier_depth=6.0))
+    assert scores[-1] > 3.5 and not excluded.any()
+
+
+def test_small_shape_difference_is_not_excluded():
+    # A high score from a tight batch, but only about 0.4 dB from the median shape
+    scores, excluded = SweepQC().outliers(curves(12, outlier_depth=2.0))
+    assert scores[-1] > 3.5 and not excluded.any()
+
+
+@pytest.mark.filterwarnings('ignore:Polyfit may be poorly conditioned')  # The synthetic sweeps span only 8 nm
+def test_fine_align_and_noise_floor_exclusions(measurement):
+    base_path, ref_file_path, _ = measurement
+    folder_path = os.path.join(base_path, 'calibration_ST2ST_1Bond_2_1')
+    csv_path = os.path.join(folder_path, os.listdir(folder_path)[0])
+    with open(csv_path) as file:
+        text = file.read()
+    with open(csv_path, 'w') as file:
+        file.write(text.replace('# Fine Align:\t Passed', '# Fine Align:\t Failed'))
+
+    # channel_1 carries the signal, channel_2 sits at the noise floor
+    calib, devices = make_calib(base_path, ref_file_path,
+                                [{'wavelength': 1461, 'channel': 'channel_1'},
+                                 {'wavelength': 1461, 'channel': 'channel_2'}])
+    assert calib.prepare(devices)
+    assert sorted(calib.channel_results('channel_1'), key=int) == ['1', '3', '4', '5', '6']
+    assert calib.channel_results('channel_2') == {}
+
+    excluded = {(row['Channel'], row['Bond']): row['Excluded'] for row in calib.qc_report()}
+    assert excluded[('channel_1', 2)] == 'Fine Align'
+    assert [excluded[('channel_1', bond)] for bond in (1, 3, 4, 5, 6)] == [''] * 5
+    assert {excluded[('channel_2', bond)] for bond in (1, 3, 4, 5, 6)} == {'Noise Floor'}
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from PwbCalib.SweepReader import MAT_SUPPORT
+from PwbCalib.LossTable import compute_losses
+
+
+@pytest.mark.skipif(not MAT_SUPPORT, reason='reading .mat files needs scipy')
+def test_unreadable_mat_falls_back_to_csv(measurement):
+    base_path, ref_file_path, devices = measurement
+    folder_path = os.path.join(base_path, 'calibration_ST2ST_1Bond_3_1')
+    csv_path = os.path.join(folder_path, os.listdir(folder_path)[0])
+    with open(os.path.splitext(csv_path)[0] + '.mat', 'wb') as file:
+        file.write(b'MATLAB 5.0 MAT-file, truncated')
+
+    rows = compute_losses(base_path, ref_file_path, use_mat=True)
+    assert [row['Bond'] for row in rows] == [1, 2, 3, 4, 5, 6]
+    assert rows[2]['Source'] == csv_path
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from PwbCalib.SweepResult import SweepResult, polyfit_batch, polyfit_weighted_batch
+from PwbCalib.LossTable import make_calib
+
+
+def sweeps(n_sweeps=5, n_points=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    wavelength = np.linspace(1260.0, 1360.0, n_points)
+    x = (wavelength - 1310) / 50
+    values = np.stack([rng.uniform(0.5, 2) + rng.normal(0, 0.3) * x + rng.normal(0, 0.5) * x ** 2
+                       + rng.normal(0, 0.05, n_points) for _ in range(n_sweeps)])
+    return wavelength, values
+
+
+def test_polyfit_batch_matches_polyfit():
+    wavelength, values = sweeps()
+    poly_coeffs, poly_fits = polyfit_batch(wavelength, values)
+    for row, coeffs, fit in zip(values, poly_coeffs, poly_fits):
+        expected = np.polyval(np.polyfit(wavelength, row, 4), wavelength)
+        np.testing.assert_allclose(fit, expected, atol=1e-6)
+        np.testing.assert_allclose(np.polyval(coeffs, wavelength), expected, atol=1e-6)
+
+
+def test_polyfit_weighted_batch_matches_polyfit_on_valid_points():
+    wavelength, values = sweeps()
+    valid = np.ones(values.shape, dtype=bool)
+    valid[0, :400] = False  # i.e. floor points at the start of a sweep
+    valid[2, 1000:1500] = False
+    values[~valid] = -80.0  # Excluded points must not pull the fit
+    poly_coeffs, poly_fits = polyfit_weighted_batch(wavelength, values, valid)
+    for row, mask, coeffs, fit in zip(values, valid, poly_coeffs, poly_fits):
+        expected = np.polyval(np.polyfit(wavelength[mask], row[mask], 4), wavelength)
+        np.testing.assert_allclose(fit, expected, atol=1e-6)
+        np.testing.assert_allclose(np.polyval(coeffs, wavelength), expected, atol=1e-6)
+
+
+@pytest.mark.filterwarnings('ignore:Polyfit may be poorly conditioned')  # The synthetic sweeps span only 8 nm
+def test_batch_results_match_single_sweep_fits(measurement):
+    base_path, ref_file_path, devices = measurement
+    calib, devices = make_calib(base_path, ref_file_path, qc=False)
+    assert calib.prepare(devices)
+    results = calib.channel_results('channel_1')  # The sweeps share a grid, so they are fitted as one stack
+
+    wavelength = devices[0]['wavelength']
+    for bond, data_list in calib.data_dict.items():
+        for data, result in zip(data_list, results[bond]):
+            single = SweepResult.from_sweep(bond, data['wavelength'], data['channel_1'], calib.reference,
+                                            'channel_1')
+            np.testing.assert_allclose(result.loss_at(wavelength), single.loss_at(wavelength), atol=1e-8)